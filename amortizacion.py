@@ -0,0 +1,232 @@
+from datetime import date, timedelta
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from models import Prestamo
+from utils import paginar
+
+# Cuota fija con interés plano: capital e interés se reparten en partes iguales.
+# Las fechas se distribuyen entre fecha_inicio y fecha_limite (la última cae en fecha_limite).
+MAX_CUOTAS = 360
+PLAZO_POR_DEFECTO = 30  # días, el mismo que usa crud.crear_prestamo
+
+
+def _repartir(totales, n):
+    # Centavos redondeados; la última cuota absorbe la diferencia para cuadrar el total
+    partes = np.repeat(np.round(totales / n, 2)[:, None], n, axis=1)
+    partes[:, -1] = np.round(totales - partes[:, :-1].sum(axis=1), 2)
+    return partes
+
+
+def _fechas(fecha_inicio, fecha_limite, cuotas: int):
+    plazo = (fecha_limite - fecha_inicio).astype(np.int64)
+    numero = np.arange(1, cuotas + 1)
+    dias = np.rint(plazo[:, None] * numero[None, :] / cuotas).astype("timedelta64[D]")
+    return fecha_inicio[:, None] + dias
+
+
+def _aplicar_pagos(cuota, monto_pagado):
+    # Lo ya pagado se aplica a las cuotas en orden
+    acumulado = np.cumsum(cuota, axis=1)
+    pagado = np.round(np.clip(monto_pagado[:, None] - (acumulado - cuota), 0, cuota), 2)
+    return acumulado, pagado
+
+
+# ✅ Cálculo vectorizado: todas las operaciones son sobre matrices (préstamos x cuotas)
+def calcular(monto_inicial, total_interes, monto_pagado, fecha_inicio, fecha_limite, cuotas: int, hoy=None):
+    hoy = np.datetime64(hoy or date.today(), "D")
+    capital = _repartir(monto_inicial, cuotas)
+    interes = _repartir(total_interes, cuotas)
+    cuota = capital + interes
+
+    acumulado, pagado = _aplicar_pagos(cuota, monto_pagado)
+    saldo = np.round(acumulado[:, -1][:, None] - acumulado, 2)
+    fechas = _fechas(fecha_inicio, fecha_limite, cuotas)
+
+    estado = np.where(
+        pagado >= cuota - 0.005, "Pagada",
+        np.where(pagado > 0, "Parcial", np.where(fechas < hoy, "Vencida", "Pendiente"))
+    )
+
+    return {
+        "fecha": fechas, "cuota": np.round(cuota, 2), "capital": capital, "interes": interes,
+        "pagado": pagado, "saldo": saldo, "estado": estado,
+    }
+
+
+# Columnas planas (Core, sin filas ORM): la carga domina el tiempo en carteras grandes
+CONSULTA = select(
+    Prestamo.id, Prestamo.cliente_id, Prestamo.monto_inicial, Prestamo.total_interes,
+    Prestamo.monto_pagado, Prestamo.fecha_inicio, Prestamo.fecha_limite,
+)
+
+_EPOCA = date(1970, 1, 1).toordinal()
+_NAT = np.iinfo(np.int64).min
+
+
+def _dias(fechas):
+    # date -> datetime64 vía ordinal: mucho más rápido que np.array(fechas, "datetime64[D]")
+    return np.fromiter(
+        (f.toordinal() - _EPOCA if f else _NAT for f in fechas), dtype=np.int64, count=len(fechas)
+    ).astype("datetime64[D]")
+
+
+def _columnas(prestamos):
+    # Filas de CONSULTA -> arreglos por columna (None -> 0 / NaT y luego fechas por defecto)
+    _, _, monto, interes, pagado, inicio, limite = zip(*prestamos)
+    hoy = np.datetime64(date.today(), "D")
+    plazo = np.timedelta64(PLAZO_POR_DEFECTO, "D")
+
+    inicio = _dias(inicio)
+    limite = _dias(limite)
+    inicio = np.where(np.isnat(inicio), np.where(np.isnat(limite), hoy, limite - plazo), inicio)
+    limite = np.where(np.isnat(limite), inicio + plazo, limite)
+
+    return (
+        np.nan_to_num(np.array(monto, dtype=float)),
+        np.nan_to_num(np.array(interes, dtype=float)),
+        np.nan_to_num(np.array(pagado, dtype=float)),
+        inicio,
+        np.maximum(limite, inicio),
+    )
+
+
+def _filas(resultado, i, cuotas):
+    fechas = resultado["fecha"][i].astype(str).tolist()
+    columnas = [resultado[c][i].tolist() for c in ("cuota", "capital", "interes", "pagado", "saldo", "estado")]
+    return [
+        {"numero": n + 1, "fecha": fecha, "cuota": cuota, "capital": capital, "interes": interes,
+         "pagado": pagado, "saldo": saldo, "estado": estado}
+        for n, (fecha, cuota, capital, interes, pagado, saldo, estado) in enumerate(zip(fechas, *columnas))
+    ]
+
+
+def validar_cuotas(cuotas: int):
+    if cuotas < 1 or cuotas > MAX_CUOTAS:
+        raise HTTPException(status_code=400, detail=f"cuotas debe estar entre 1 y {MAX_CUOTAS}")
+
+
+def _filtrar(consulta, prestamo_id=None, cliente_id=None, estado=None):
+    if prestamo_id is not None:
+        consulta = consulta.where(Prestamo.id == prestamo_id)
+    if cliente_id is not None:
+        consulta = consulta.where(Prestamo.cliente_id == cliente_id)
+    if estado:
+        consulta = consulta.where(Prestamo.estado == estado)
+    return consulta
+
+
+def _armar(prestamos, cuotas: int):
+    if not prestamos:
+        return []
+
+    resultado = calcular(*_columnas(prestamos), cuotas)
+    return [
+        {
+            "prestamo_id": p.id,
+            "cliente_id": p.cliente_id,
+            "total": round(float(resultado["cuota"][i].sum()), 2),
+            "cuotas": _filas(resultado, i, cuotas),
+        }
+        for i, p in enumerate(prestamos)
+    ]
+
+
+# ✅ Cronograma de un préstamo (o de un conjunto acotado) en una consulta y un cálculo
+def cronogramas(db: Session, cuotas: int, prestamo_id: int = None, cliente_id: int = None, estado: str = None):
+    validar_cuotas(cuotas)
+    consulta = _filtrar(CONSULTA, prestamo_id, cliente_id, estado)
+    return _armar(db.execute(consulta.order_by(Prestamo.id)).all(), cuotas)
+
+
+# ✅ Cronogramas de la cartera por páginas: cada página es un solo cálculo vectorizado
+MAX_FILAS_PAGINA = 50000  # préstamos x cuotas por respuesta
+
+
+def cronogramas_paginados(
+    db: Session, cuotas: int, page: int = 1, limit: int = 100, cursor: str = None,
+    incluir_total: bool = True, cliente_id: int = None, estado: str = None
+):
+    validar_cuotas(cuotas)
+    if limit * cuotas > MAX_FILAS_PAGINA:
+        raise HTTPException(status_code=400, detail=f"limit x cuotas no puede superar {MAX_FILAS_PAGINA}")
+
+    consulta = _filtrar(db.query(*CONSULTA.selected_columns), cliente_id=cliente_id, estado=estado)
+    pagina = paginar(db, consulta, Prestamo, [Prestamo.id], page, limit, cursor, incluir_total)
+    pagina["data"] = _armar(pagina["data"], cuotas)
+    return pagina
+
+
+# ✅ Flujo de caja esperado: lo pendiente de cada cuota en su fecha, por día o por semana
+MAX_DIAS_FLUJO = 365
+AGRUPACIONES = {"dia": 1, "semana": 7}
+
+
+def proyectar_flujo(db: Session, dias: int = 90, agrupacion: str = "dia", cuotas: int = 1, hoy=None):
+    validar_cuotas(cuotas)
+    if dias < 1 or dias > MAX_DIAS_FLUJO:
+        raise HTTPException(status_code=400, detail=f"dias debe estar entre 1 y {MAX_DIAS_FLUJO}")
+    if agrupacion not in AGRUPACIONES:
+        raise HTTPException(status_code=400, detail=f"agrupacion debe ser una de: {', '.join(AGRUPACIONES)}")
+
+    hoy = hoy or date.today()
+    vigentes = (Prestamo.estado.in_(("Activo", "Atrasado")), Prestamo.monto_restante > 0)
+
+    if cuotas == 1:
+        # Un solo pago por préstamo: la base agrupa el saldo por fecha límite (pocas filas)
+        limite = func.coalesce(Prestamo.fecha_limite, hoy)  # sin fecha límite: exigible hoy
+        filas = db.execute(
+            select(limite, func.sum(Prestamo.monto_restante), func.count(Prestamo.id))
+            .where(*vigentes)
+            .group_by(limite)
+        ).all()
+        fechas, pendiente, conteos = (list(c) for c in zip(*filas)) if filas else ([], [], [])
+        desfase = (_dias(fechas) - np.datetime64(hoy, "D")).astype(np.int64)
+        pendiente = np.array(pendiente, dtype=float)
+        cantidad = int(sum(conteos))
+    else:
+        prestamos = db.execute(CONSULTA.where(*vigentes)).all()
+        cantidad = len(prestamos)
+        if prestamos:
+            monto, interes, pagado, inicio, limite = _columnas(prestamos)
+            cuota = _repartir(monto + interes, cuotas)
+            _, aplicado = _aplicar_pagos(cuota, pagado)
+            pendiente = cuota - aplicado
+            desfase = (_fechas(inicio, limite, cuotas) - np.datetime64(hoy, "D")).astype(np.int64)
+        else:
+            pendiente = desfase = np.zeros(0)
+
+    serie = np.zeros(dias)
+    vencido = posterior = 0.0
+    if len(pendiente):
+        # Cuotas ya vencidas sin pagar: se reportan aparte, no se asumen cobradas en una fecha
+        vencido = float(pendiente[desfase < 0].sum())
+        posterior = float(pendiente[desfase >= dias].sum())
+        en_rango = (desfase >= 0) & (desfase < dias)
+        serie = np.bincount(desfase[en_rango], weights=pendiente[en_rango], minlength=dias)
+
+    paso = AGRUPACIONES[agrupacion]
+    inicios = np.arange(0, dias, paso)
+    montos = np.round(np.add.reduceat(serie, inicios), 2)
+    acumulado = np.round(np.cumsum(montos), 2)
+
+    return {
+        "fecha_corte": hoy,
+        "dias": dias,
+        "agrupacion": agrupacion,
+        "cuotas": cuotas,
+        "prestamos": cantidad,
+        "vencido_sin_pagar": round(vencido, 2),
+        "total_periodo": round(float(serie.sum()), 2),
+        "posterior_al_periodo": round(posterior, 2),
+        "flujo": [
+            {
+                "desde": hoy + timedelta(days=int(inicio)),
+                "hasta": hoy + timedelta(days=int(min(inicio + paso, dias) - 1)),
+                "monto": monto,
+                "acumulado": total,
+            }
+            for inicio, monto, total in zip(inicios.tolist(), montos.tolist(), acumulado.tolist())
+        ],
+    }
@@ -1,19 +1,46 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
+import database
 from database import SessionLocal
 from models import Usuario
+from utils import CacheLRU
 
 # Configuración JWT
 SECRET_KEY = "super_secret_key_cambiala_123"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-# Para encriptar contraseñas
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Caché de tokens decodificados y usuarios autenticados
+AUTH_CACHE_TTL_SEGUNDOS = int(os.getenv("AUTH_CACHE_TTL_SEGUNDOS", 60))
+AUTH_CACHE_MAX = int(os.getenv("AUTH_CACHE_MAX", 10000))
+
+tokens_cache = CacheLRU(AUTH_CACHE_MAX, AUTH_CACHE_TTL_SEGUNDOS)
+usuarios_cache = CacheLRU(AUTH_CACHE_MAX, AUTH_CACHE_TTL_SEGUNDOS)
+
+# Para encriptar contraseñas (rondas configurables, por defecto las de passlib)
+PASSWORD_ROUNDS = int(os.getenv("PASSWORD_ROUNDS", 29000))
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PASSWORD_ROUNDS
+)
+
+# Pool de procesos exclusivo para hashing (no compite con los hilos de la API)
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", min(2, os.cpu_count() or 1)))
+HASH_MAX_PENDIENTES = int(os.getenv("HASH_MAX_PENDIENTES", 64))
+
+_hash_pool = None
+_hash_lock = threading.Lock()
+_hash_metricas = {"en_cola": 0, "max_en_cola": 0, "completados": 0, "fallidos": 0, "rechazados": 0}
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
@@ -27,17 +54,53 @@ def get_db():
     finally:
         db.close()
 
+
+# ✅ Lecturas en la réplica, salvo "leer lo propio": quien acaba de escribir
+# (o envía X-Consistencia: primaria) lee de la primaria durante REPLICA_LAG_SEGUNDOS
+escrituras_recientes = CacheLRU(AUTH_CACHE_MAX, database.REPLICA_LAG_SEGUNDOS)
+
+
+def registrar_escritura(request: Request):
+    credencial = request.headers.get("authorization")
+    if credencial:
+        escrituras_recientes.guardar(credencial, True)
+
+
+def leer_de_primaria(request: Request):
+    if database.replica_engine is None:
+        return True
+    if request.headers.get("x-consistencia", "").lower() == "primaria":
+        return True
+    credencial = request.headers.get("authorization")
+    return bool(credencial) and escrituras_recientes.obtener(credencial) is not None
+
+
+def get_read_db(request: Request):
+    primaria = leer_de_primaria(request)
+    # El middleware lo copia a X-Origen-Lectura (también en archivos y respuestas directas)
+    request.state.origen_lectura = "primaria" if primaria else "replica"
+    db = SessionLocal() if primaria else database.ReplicaSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ✅ Sesión asíncrona de lectura, con el mismo ruteo a la réplica (solo con DB_ASYNC=1)
+async def get_async_read_db(request: Request):
+    primaria = database.async_replica_engine is None or leer_de_primaria(request)
+    request.state.origen_lectura = "primaria" if primaria else "replica"
+    fabrica = database.AsyncSessionLocal if primaria else database.AsyncReplicaSessionLocal
+    async with fabrica() as db:
+        yield db
+
 # Encriptar contraseña
 def hash_password(password):
-    print("✅ Contraseña recibida:", password, type(password))
+    # recortar a 72 caracteres para evitar error bcrypt
     password = str(password)[:72]
     return pwd_context.hash(password)
 
 
-    # recortar a 72 caracteres para evitar error bcrypt
-    password = password[:72]
-
-
 # Verificar contraseña
 
 def verify_password(password: str, hashed: str):
@@ -46,6 +109,56 @@ def verify_password(password: str, hashed: str):
     return pwd_context.verify(password, hashed)
 
 
+# ✅ Hashing en el pool de procesos con cola acotada
+def _obtener_hash_pool():
+    global _hash_pool
+    with _hash_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        return _hash_pool
+
+
+async def _ejecutar_hash(funcion, *args):
+    pool = _obtener_hash_pool()
+    with _hash_lock:
+        if _hash_metricas["en_cola"] >= HASH_MAX_PENDIENTES:
+            _hash_metricas["rechazados"] += 1
+            raise HTTPException(status_code=503, detail="Demasiadas solicitudes de autenticación, intente de nuevo")
+        _hash_metricas["en_cola"] += 1
+        _hash_metricas["max_en_cola"] = max(_hash_metricas["max_en_cola"], _hash_metricas["en_cola"])
+
+    resultado = "fallidos"
+    try:
+        valor = await asyncio.wrap_future(pool.submit(funcion, *args))
+        resultado = "completados"
+        return valor
+    finally:
+        with _hash_lock:
+            _hash_metricas["en_cola"] -= 1
+            _hash_metricas[resultado] += 1
+
+
+async def hash_password_async(password):
+    return await _ejecutar_hash(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed: str):
+    return await _ejecutar_hash(verify_password, password, hashed)
+
+
+def metricas_hash():
+    with _hash_lock:
+        return {**_hash_metricas, "workers": HASH_WORKERS, "max_pendientes": HASH_MAX_PENDIENTES}
+
+
+def cerrar_hash_pool():
+    global _hash_pool
+    with _hash_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(wait=False, cancel_futures=True)
+            _hash_pool = None
+
+
 # Crear JWT
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -53,15 +166,46 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-# Obtener usuario autenticado desde token
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+# Copia desacoplada de la sesión: se puede compartir entre peticiones
+def _copiar_usuario(user: Usuario):
+    return Usuario(id=user.id, nombre=user.nombre, email=user.email)
+
+
+def _decodificar_token(token: str):
+    user_id = tokens_cache.obtener(token)
+    if user_id is not None:
+        return user_id
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
     except JWTError:
         raise HTTPException(status_code=401, detail="Token inválido o expirado")
 
+    # Nunca se cachea un token más allá de su expiración
+    restante = payload.get("exp", 0) - time.time()
+    if user_id is not None and restante > 0:
+        tokens_cache.guardar(token, user_id, ttl=restante)
+    return user_id
+
+
+# ✅ Invalidar al modificar un usuario
+def invalidar_usuario(user_id):
+    usuarios_cache.invalidar(str(user_id))
+
+
+# Obtener usuario autenticado desde token
+def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    user_id = _decodificar_token(token)
+
+    user = usuarios_cache.obtener(str(user_id))
+    if user:
+        return user
+
     user = db.query(Usuario).filter(Usuario.id == user_id).first()
     if not user:
         raise HTTPException(status_code=401, detail="Usuario no encontrado")
+
+    user = _copiar_usuario(user)
+    usuarios_cache.guardar(str(user_id), user)
     return user
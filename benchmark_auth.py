@@ -0,0 +1,36 @@
+import time
+from database import SessionLocal
+from models import Usuario
+import auth
+
+# Mide el costo de get_current_user por petición, sin caché y con caché
+N = 2000
+
+db = SessionLocal()
+usuario = db.query(Usuario).first()
+if not usuario:
+    print("❌ No hay usuarios registrados para la prueba")
+    raise SystemExit(1)
+
+token = auth.create_access_token({"sub": str(usuario.id)})
+
+
+def medir(con_cache: bool):
+    auth.tokens_cache.limpiar()
+    auth.usuarios_cache.limpiar()
+    inicio = time.perf_counter()
+    for _ in range(N):
+        if not con_cache:
+            auth.tokens_cache.limpiar()
+            auth.usuarios_cache.limpiar()
+        auth.get_current_user(db=db, token=token)
+    return (time.perf_counter() - inicio) / N * 1_000_000
+
+
+sin_cache = medir(False)
+con_cache = medir(True)
+db.close()
+
+print(f"Sin caché: {sin_cache:.1f} µs por petición")
+print(f"Con caché: {con_cache:.1f} µs por petición")
+print(f"Mejora: {sin_cache / con_cache:.1f}x")
@@ -0,0 +1,63 @@
+import json
+import time
+from datetime import date, timedelta
+from pydantic import TypeAdapter
+from models import Cliente, Prestamo, Pago
+import schemas
+import serializacion
+
+# Compara filas/segundo serializadas: ruta normal (Pydantic + json) vs. ruta rápida (orjson)
+N = 20000
+
+if serializacion.orjson is None:
+    print("❌ orjson no está instalado")
+    raise SystemExit(1)
+
+# Objetos en memoria (sin base de datos): se mide solo la serialización
+clientes = [
+    Cliente(id=i, nombre=f"Cliente {i}", cedula=str(1000 + i), telefono="3000000", correo=f"c{i}@correo.com",
+            direccion="Calle 1", monto=1000.0, fecha=date(2024, 1, 1), estado="Activo")
+    for i in range(1, 501)
+]
+prestamos = [
+    Prestamo(id=i, cliente_id=clientes[i % 500].id, cliente=clientes[i % 500], monto_inicial=1000.0,
+             total_interes=100.0, monto_pagado=250.0, monto_restante=850.0, estado="Activo",
+             fecha_inicio=date(2024, 1, 1), fecha_limite=date(2024, 1, 1) + timedelta(days=30))
+    for i in range(1, N + 1)
+]
+pagos = [
+    Pago(id=i, cliente_id=p.cliente_id, cliente=p.cliente, prestamo_id=p.id, prestamo=p,
+         monto_pagado=250.0, fecha_pago=date(2024, 1, 15), estado="Completado")
+    for i, p in enumerate(prestamos, start=1)
+]
+
+
+def ruta_normal(objetos, esquema):
+    # Lo que hace FastAPI con response_model: validar from_attributes, volcar y json.dumps
+    adaptador = TypeAdapter(list[esquema])
+    datos = adaptador.dump_python(adaptador.validate_python(objetos, from_attributes=True), mode="json")
+    return json.dumps(datos, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def ruta_rapida(objetos, serializar):
+    return serializacion.RespuestaRapida([serializar(o) for o in objetos]).body
+
+
+def medir(funcion, *args):
+    inicio = time.perf_counter()
+    cuerpo = funcion(*args)
+    return N / (time.perf_counter() - inicio), cuerpo
+
+
+for nombre, objetos, esquema, serializar in (
+    ("Prestamo", prestamos, schemas.Prestamo, serializacion.serializar_prestamo),
+    ("PagoResponse", pagos, schemas.PagoResponse, serializacion.serializar_pago),
+):
+    normal, cuerpo_normal = medir(ruta_normal, objetos, esquema)
+    rapida, cuerpo_rapido = medir(ruta_rapida, objetos, serializar)
+    iguales = json.loads(cuerpo_normal) == json.loads(cuerpo_rapido)
+
+    print(f"{nombre} ({N} filas)")
+    print(f"  Normal: {normal:,.0f} filas/s")
+    print(f"  Rápida: {rapida:,.0f} filas/s ({rapida / normal:.1f}x)")
+    print(f"  Misma salida: {'✅' if iguales else '❌'}")
@@ -0,0 +1,216 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Cliente
+
+# Reconstrucción periódica para ver cambios hechos por otros procesos
+BUSQUEDA_REFRESCO_SEGUNDOS = int(os.getenv("BUSQUEDA_REFRESCO_SEGUNDOS", 300))
+
+CAMPOS = ("nombre", "cedula", "telefono", "correo")
+PESOS = {"nombre": 3, "cedula": 3, "telefono": 2, "correo": 1}
+_SEPARADORES = re.compile(r"[^0-9a-z]+")
+
+
+# ✅ Normalización: minúsculas y sin tildes ("Peña" == "pena")
+def normalizar(texto):
+    if not texto:
+        return ""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def tokens(texto):
+    return [t for t in _SEPARADORES.split(normalizar(texto)) if t]
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceClientes:
+    """Índice invertido en memoria: trigramas para subcadenas; los términos cortos se revisan en el texto."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._documentos = {}  # id -> {campo: texto normalizado}
+        self._trigramas = defaultdict(set)
+        self._pendientes = None  # cambios confirmados durante una reconstrucción
+        self.construido = 0.0
+
+    def _terminos(self, documento):
+        trigramas = set()
+        for texto in documento.values():
+            for token in _SEPARADORES.split(texto):
+                if token:
+                    trigramas |= _trigramas(token)
+        return trigramas
+
+    def recibe_cambios(self):
+        return bool(self.construido) or self._pendientes is not None
+
+    def agregar(self, cliente_id, nombre, cedula, telefono, correo):
+        documento = {
+            "nombre": normalizar(nombre),
+            # Documentos y teléfonos como un solo token: "300-123" == "300123"
+            "cedula": _SEPARADORES.sub("", normalizar(cedula)),
+            "telefono": _SEPARADORES.sub("", normalizar(telefono)),
+            "correo": normalizar(correo),
+        }
+        with self._lock:
+            self.quitar(cliente_id)
+            self._documentos[cliente_id] = documento
+            for t in self._terminos(documento):
+                self._trigramas[t].add(cliente_id)
+            if self._pendientes is not None:
+                self._pendientes.append(("agregar", (cliente_id, nombre, cedula, telefono, correo)))
+
+    def quitar(self, cliente_id):
+        with self._lock:
+            if self._pendientes is not None:
+                self._pendientes.append(("quitar", (cliente_id,)))
+            documento = self._documentos.pop(cliente_id, None)
+            if not documento:
+                return
+            for t in self._terminos(documento):
+                self._trigramas[t].discard(cliente_id)
+
+    # Se lee la tabla sin bloquear las búsquedas; lo confirmado mientras tanto se reaplica al final
+    def reconstruir(self, db: Session):
+        with self._lock:
+            self._pendientes = []
+        try:
+            filas = db.query(Cliente.id, Cliente.nombre, Cliente.cedula, Cliente.telefono, Cliente.correo).yield_per(1000)
+            nuevo = IndiceClientes()
+            for fila in filas:
+                nuevo.agregar(*fila)
+
+            with self._lock:
+                for accion, argumentos in self._pendientes:
+                    getattr(nuevo, accion)(*argumentos)
+                self._documentos = nuevo._documentos
+                self._trigramas = nuevo._trigramas
+                self.construido = time.monotonic()
+        finally:
+            with self._lock:
+                self._pendientes = None
+
+    def _candidatos(self, token, previos=None):
+        if len(token) < 3:
+            # Sin trigramas: subcadena sobre el texto (solo de los candidatos previos si los hay)
+            universo = self._documentos if previos is None else previos
+            return {
+                cliente_id for cliente_id in universo
+                if any(token in texto for texto in self._documentos[cliente_id].values())
+            }
+
+        conjuntos = sorted((self._trigramas.get(t, set()) for t in _trigramas(token)), key=len)
+        candidatos = set(conjuntos[0]) if conjuntos else set()
+        for conjunto in conjuntos[1:]:
+            candidatos &= conjunto
+            if not candidatos:
+                break
+        return candidatos
+
+    # ✅ Puntaje: token exacto > prefijo > subcadena, ponderado por campo
+    def _puntaje(self, documento, terminos):
+        total = 0
+        for termino in terminos:
+            mejor = 0
+            for campo, texto in documento.items():
+                palabras = _SEPARADORES.split(texto)
+                if termino in palabras:
+                    valor = 3
+                elif any(p.startswith(termino) for p in palabras):
+                    valor = 2
+                elif termino in texto:
+                    valor = 1
+                else:
+                    continue
+                mejor = max(mejor, valor * PESOS[campo])
+            if not mejor:
+                return 0
+            total += mejor
+        return total
+
+    def buscar(self, texto, limite: int):
+        terminos = tokens(texto)
+        if not terminos:
+            return []
+
+        with self._lock:
+            candidatos = None
+            for termino in sorted(terminos, key=len, reverse=True):
+                encontrados = self._candidatos(termino, candidatos)
+                candidatos = encontrados if candidatos is None else candidatos & encontrados
+                if not candidatos:
+                    return []
+
+            puntuados = []
+            for cliente_id in candidatos:
+                documento = self._documentos[cliente_id]
+                puntaje = self._puntaje(documento, terminos)
+                if puntaje:
+                    puntuados.append((-puntaje, documento["nombre"], cliente_id))
+
+        puntuados.sort()
+        return [cliente_id for _, _, cliente_id in puntuados[:limite]]
+
+
+indice = IndiceClientes()
+
+
+_reconstruyendo = threading.Lock()
+
+
+def _refrescar():
+    db = SessionLocal()
+    try:
+        indice.reconstruir(db)
+    finally:
+        db.close()
+        _reconstruyendo.release()
+
+
+# ✅ Una sola reconstrucción a la vez; el refresco corre en segundo plano con el índice anterior en uso
+def buscar(db: Session, texto, limite: int):
+    if not indice.construido:
+        with _reconstruyendo:
+            if not indice.construido:
+                indice.reconstruir(db)
+    elif time.monotonic() - indice.construido > BUSQUEDA_REFRESCO_SEGUNDOS and _reconstruyendo.acquire(blocking=False):
+        threading.Thread(target=_refrescar, name="busqueda-refresco", daemon=True).start()
+    return indice.buscar(texto, limite)
+
+
+# ✅ Sincronización: los cambios se aplican al índice solo si la transacción confirma
+@event.listens_for(Session, "after_flush")
+def _registrar_cambios(session, flush_context):
+    cambios = session.info.setdefault("busqueda_cambios", [])
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Cliente) and obj not in session.deleted:
+            cambios.append(("agregar", obj.id, tuple(getattr(obj, c) for c in CAMPOS)))
+    for obj in session.deleted:
+        if isinstance(obj, Cliente):
+            cambios.append(("quitar", obj.id, None))
+
+
+@event.listens_for(Session, "after_commit")
+def _aplicar_cambios(session):
+    for accion, cliente_id, valores in session.info.pop("busqueda_cambios", []):
+        if not indice.recibe_cambios():
+            continue
+        if accion == "agregar":
+            indice.agregar(cliente_id, *valores)
+        else:
+            indice.quitar(cliente_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_cambios(session):
+    session.info.pop("busqueda_cambios", None)
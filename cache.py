@@ -0,0 +1,148 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from models import VersionTabla
+
+# Configuración de la caché de reportes
+REPORTES_CACHE_DIR = os.getenv("REPORTES_CACHE_DIR", os.path.join(tempfile.gettempdir(), "reportes_cache"))
+REPORTES_CACHE_MAX_BYTES = int(os.getenv("REPORTES_CACHE_MAX_MB", 512)) * 1024 * 1024
+
+_lock = threading.Lock()
+_entradas = OrderedDict()  # clave -> (ruta, bytes), de la menos a la más usada
+_total_bytes = 0
+
+# Tablas cuya versión forma parte de la clave de los reportes
+TABLAS_VERSIONADAS = ("clientes", "prestamos", "pagos")
+
+
+# ✅ Versión por tabla en la base, incrementada en el mismo flush que el cambio:
+# todos los workers ven la misma versión (detecta UPDATE, que no cambian count/max id)
+@event.listens_for(Session, "after_flush")
+def _contar_cambios(session, flush_context):
+    modificados = list(session.new) + list(session.deleted) + [o for o in session.dirty if session.is_modified(o)]
+    tablas = {getattr(obj, "__tablename__", None) for obj in modificados}
+    session.info.setdefault("versiones_pendientes", set()).update(tablas.intersection(TABLAS_VERSIONADAS))
+
+
+# Orden de bloqueo de las filas compartidas en toda escritura: resumen_cartera → pagos_mensuales
+# (after_flush de resumen.py) → versiones_tablas (aquí, después de todos los after_flush)
+@event.listens_for(Session, "after_flush_postexec")
+def _aplicar_versiones(session, flush_context):
+    for tabla in sorted(session.info.pop("versiones_pendientes", ())):
+        marcar_cambio(session, tabla)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_versiones(session):
+    session.info.pop("versiones_pendientes", None)
+
+
+# Cambios hechos fuera del ORM (UPDATE/INSERT directos): se aplican en el próximo flush
+def registrar_cambio(db: Session, tabla):
+    db.info.setdefault("versiones_pendientes", set()).add(tabla)
+
+
+def marcar_cambio(db: Session, tabla):
+    versiones = VersionTabla.__table__
+    actualizado = db.execute(
+        update(versiones).where(versiones.c.tabla == tabla).values(version=versiones.c.version + 1)
+    )
+    if actualizado.rowcount == 0:
+        db.execute(versiones.insert().values(tabla=tabla, version=1))
+
+
+# ✅ Versión de los datos: solo las filas de versiones_tablas (búsqueda por clave primaria).
+# Todas las escrituras la incrementan (flush del ORM, pagos en lote, barrido de atrasados)
+def version_datos(db: Session, modelos):
+    tablas = [modelo.__tablename__ for modelo in modelos]
+    versiones = dict(db.execute(
+        select(VersionTabla.tabla, VersionTabla.version).where(VersionTabla.tabla.in_(tablas))
+    ).all())
+    return "|".join(f"{tabla}:{versiones.get(tabla, 0)}" for tabla in tablas)
+
+
+def clave_reporte(tipo, formato, version, filtros=None):
+    crudo = f"{tipo}|{formato}|{version}|{sorted((filtros or {}).items())}"
+    return hashlib.sha1(crudo.encode()).hexdigest()
+
+
+def _cargar_existentes():
+    global _total_bytes
+    os.makedirs(REPORTES_CACHE_DIR, exist_ok=True)
+    archivos = []
+    for nombre in os.listdir(REPORTES_CACHE_DIR):
+        ruta = os.path.join(REPORTES_CACHE_DIR, nombre)
+        if os.path.isfile(ruta) and not nombre.startswith("."):
+            archivos.append((os.path.getmtime(ruta), nombre, ruta))
+
+    for _, nombre, ruta in sorted(archivos):
+        tamano = os.path.getsize(ruta)
+        _entradas[os.path.splitext(nombre)[0]] = (ruta, tamano)
+        _total_bytes += tamano
+
+
+# ✅ Buscar artefacto (lo marca como usado recientemente)
+def obtener(clave):
+    with _lock:
+        entrada = _entradas.get(clave)
+        if not entrada:
+            return None
+        if not os.path.exists(entrada[0]):
+            _quitar(clave)
+            return None
+        _entradas.move_to_end(clave)
+        return entrada[0]
+
+
+def ruta_temporal(extension):
+    os.makedirs(REPORTES_CACHE_DIR, exist_ok=True)
+    fd, ruta = tempfile.mkstemp(suffix=f".{extension}", prefix=".tmp_", dir=REPORTES_CACHE_DIR)
+    os.close(fd)
+    return ruta
+
+
+# ✅ Guardar artefacto generado y expulsar los menos usados si se supera el tamaño
+def guardar(clave, origen, extension):
+    global _total_bytes
+    os.makedirs(REPORTES_CACHE_DIR, exist_ok=True)
+    destino = os.path.join(REPORTES_CACHE_DIR, f"{clave}.{extension}")
+    shutil.move(origen, destino)
+    tamano = os.path.getsize(destino)
+
+    with _lock:
+        if clave in _entradas:
+            _total_bytes -= _entradas[clave][1]
+        _entradas[clave] = (destino, tamano)
+        _entradas.move_to_end(clave)
+        _total_bytes += tamano
+
+        # Nunca se expulsa la entrada recién guardada
+        while _total_bytes > REPORTES_CACHE_MAX_BYTES and len(_entradas) > 1:
+            _quitar(next(iter(_entradas)), borrar=True)
+
+    return destino
+
+
+def _quitar(clave, borrar=False):
+    global _total_bytes
+    ruta, tamano = _entradas.pop(clave)
+    _total_bytes -= tamano
+    if borrar and os.path.exists(ruta):
+        os.remove(ruta)
+
+
+def estadisticas():
+    with _lock:
+        return {
+            "entradas": len(_entradas),
+            "bytes": _total_bytes,
+            "max_bytes": REPORTES_CACHE_MAX_BYTES,
+        }
+
+
+_cargar_existentes()
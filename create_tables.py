@@ -1,6 +1,5 @@
-from database import Base, engine
-from models import Cliente
+import migraciones
 
-print("🔧 Creando tablas en la base de datos...")
-Base.metadata.create_all(bind=engine)
-print("✅ Tablas creadas correctamente.")
+print("🔧 Aplicando migraciones en la base de datos...")
+aplicadas = migraciones.migrar()
+print(f"✅ Migraciones aplicadas: {aplicadas}" if aplicadas else "✅ El esquema ya está al día.")
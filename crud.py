@@ -1,8 +1,19 @@
+import os
+import random
+import time
+from sqlalchemy import insert, update, or_
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session, joinedload
 from fastapi import HTTPException
 from datetime import date, timedelta
 from models import Cliente, Prestamo, Pago
 import schemas
+import resumen  # mantiene los contadores del dashboard en cada flush
+import cache
+
+# Reintentos ante deadlock / espera de bloqueo agotada (con espera exponencial y jitter)
+PAGO_REINTENTOS = max(1, int(os.getenv("PAGO_REINTENTOS", 5)))
+PAGO_ESPERA_BASE_S = float(os.getenv("PAGO_ESPERA_BASE_S", 0.01))
 
 # ✅ CREAR CLIENTE
 def crear_cliente(db: Session, cliente: schemas.ClienteCreate):
@@ -68,6 +79,16 @@ def listar_prestamos(db: Session):
     )
 
 
+# ✅ PRÉSTAMOS DE UN CLIENTE
+def prestamos_por_cliente(db: Session, cliente_id: int):
+    return (
+        db.query(Prestamo)
+        .options(joinedload(Prestamo.cliente))
+        .filter(Prestamo.cliente_id == cliente_id)
+        .all()
+    )
+
+
 # ✅ OBTENER PRÉSTAMO
 def obtener_prestamo(db: Session, prestamo_id: int):
     return (
@@ -103,51 +124,235 @@ def eliminar_prestamo(db: Session, prestamo_id: int):
     return {"mensaje": "Préstamo eliminado exitosamente"}
 
 
-# ✅ CREAR PAGO
-def crear_pago(db: Session, pago: schemas.PagoCreate):
+# ✅ CONSULTA DE PAGOS (PagoResponse anida cliente y préstamo con su cliente)
+# Todas son relaciones muchos-a-uno: un solo SELECT con JOINs, sin cargas por fila
+CARGA_PAGO = (
+    joinedload(Pago.cliente),
+    joinedload(Pago.prestamo).joinedload(Prestamo.cliente),
+)
+
+
+def consulta_pagos(db: Session):
+    return db.query(Pago).options(*CARGA_PAGO)
+
 
+# ✅ CREAR PAGO (seguro ante pagos concurrentes sobre el mismo préstamo)
+def _es_reintentable(error: OperationalError):
+    codigo = error.orig.args[0] if getattr(error.orig, "args", None) else None
+    # MySQL: 1213 deadlock, 1205 espera de bloqueo agotada; SQLite: base bloqueada
+    return codigo in (1205, 1213) or "database is locked" in str(error.orig)
+
+
+def _rechazo_pago(db: Session, pago: schemas.PagoCreate):
+    # El UPDATE condicionado no afectó filas: se averigua el motivo para el mensaje
+    prestamo = db.query(Prestamo).filter(Prestamo.id == pago.prestamo_id).first()
+    if not prestamo:
+        return HTTPException(status_code=404, detail="Préstamo no encontrado")
+    if prestamo.estado == "Pagado":
+        return HTTPException(status_code=400, detail="Este préstamo ya está pagado")
+    return HTTPException(
+        status_code=400,
+        detail=f"El pago supera el saldo restante. Saldo: {prestamo.monto_restante}"
+    )
+
+
+def _aplicar_pago(db: Session, pago: schemas.PagoCreate):
     cliente = obtener_cliente_por_id(db, pago.cliente_id)
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
-    prestamo = obtener_prestamo(db, pago.prestamo_id)
-    if not prestamo:
-        raise HTTPException(status_code=404, detail="Préstamo no encontrado")
-
     if pago.monto_pagado <= 0:
         raise HTTPException(status_code=400, detail="El monto pagado debe ser mayor a 0")
 
-    if prestamo.estado == "Pagado":
-        raise HTTPException(status_code=400, detail="Este préstamo ya está pagado")
-
-    if pago.monto_pagado > prestamo.monto_restante:
-        raise HTTPException(
-            status_code=400,
-            detail=f"El pago supera el saldo restante. Saldo: {prestamo.monto_restante}"
+    # UPDATE atómico condicionado al saldo: toma el bloqueo de la fila (MySQL) o de escritura (SQLite)
+    # antes de leer, así dos pagos simultáneos nunca parten del mismo saldo
+    aplicado = db.execute(
+        update(Prestamo)
+        .where(
+            Prestamo.id == pago.prestamo_id,
+            or_(Prestamo.estado != "Pagado", Prestamo.estado.is_(None)),
+            Prestamo.monto_restante >= pago.monto_pagado,
         )
-
-    fecha_pago = pago.fecha_pago or date.today()
+        .values(
+            monto_pagado=Prestamo.monto_pagado + pago.monto_pagado,
+            monto_restante=Prestamo.monto_restante - pago.monto_pagado,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not aplicado:
+        raise _rechazo_pago(db, pago)
+
+    # Con la fila ya bloqueada se relee el saldo nuevo; el cambio de estado pasa por el ORM
+    # para que el resumen del dashboard vea la transición
+    prestamo = (
+        db.query(Prestamo)
+        .filter(Prestamo.id == pago.prestamo_id)
+        .populate_existing()
+        .one()
+    )
+    if prestamo.monto_restante <= 0:
+        prestamo.estado = "Pagado"
+    elif date.today() > prestamo.fecha_limite:
+        prestamo.estado = "Atrasado"
+    else:
+        prestamo.estado = "Activo"
 
     nuevo_pago = Pago(
         cliente_id=pago.cliente_id,
         prestamo_id=pago.prestamo_id,
         monto_pagado=pago.monto_pagado,
-        fecha_pago=fecha_pago,
+        fecha_pago=pago.fecha_pago or date.today(),
         estado="Completado"
     )
-
     db.add(nuevo_pago)
 
-    prestamo.monto_pagado += pago.monto_pagado
-    prestamo.monto_restante = (prestamo.monto_inicial + prestamo.total_interes) - prestamo.monto_pagado
+    # Los saldos se movieron con un UPDATE fuera del ORM: la versión de préstamos se sube
+    # en el flush del commit, después del resumen (mismo orden de bloqueo que los lotes)
+    cache.registrar_cambio(db, Prestamo.__tablename__)
+    db.commit()
+    return nuevo_pago
 
-    if prestamo.monto_restante <= 0:
-        prestamo.estado = "Pagado"
-    elif date.today() > prestamo.fecha_limite:
-        prestamo.estado = "Atrasado"
-    else:
-        prestamo.estado = "Activo"
 
-    db.commit()
+# Reintenta la transacción completa ante deadlock o espera de bloqueo agotada
+def _con_reintentos(db: Session, operacion, *args):
+    for intento in range(PAGO_REINTENTOS):
+        try:
+            return operacion(db, *args)
+        except OperationalError as e:
+            db.rollback()
+            if not _es_reintentable(e) or intento == PAGO_REINTENTOS - 1:
+                raise
+            time.sleep(PAGO_ESPERA_BASE_S * (2 ** intento) * (1 + random.random()))
+        except HTTPException:
+            db.rollback()
+            raise
+
+
+def crear_pago(db: Session, pago: schemas.PagoCreate):
+    nuevo_pago = _con_reintentos(db, _aplicar_pago, pago)
     db.refresh(nuevo_pago)
     return nuevo_pago
+
+
+# ✅ CREAR PAGOS EN LOTE (un solo query de préstamos y un solo INSERT multi-fila)
+def crear_pagos_bulk(db: Session, pagos: list[schemas.PagoCreate]):
+    return _con_reintentos(db, _aplicar_pagos_bulk, pagos)
+
+
+def _aplicar_pagos_bulk(db: Session, pagos: list[schemas.PagoCreate]):
+    hoy = date.today()
+    prestamo_ids = sorted({p.prestamo_id for p in pagos})
+    cliente_ids = {p.cliente_id for p in pagos}
+
+    # Bloqueo en orden de id para no generar deadlocks con otros lotes
+    prestamos = {
+        p.id: p for p in db.query(Prestamo)
+        .filter(Prestamo.id.in_(prestamo_ids))
+        .order_by(Prestamo.id)
+        .with_for_update()
+        .all()
+    }
+    clientes = {c for (c,) in db.query(Cliente.id).filter(Cliente.id.in_(cliente_ids)).all()}
+
+    resultados = []
+    filas = []
+    meses = {}
+
+    for indice, pago in enumerate(pagos):
+        prestamo = prestamos.get(pago.prestamo_id)
+        error = None
+
+        if pago.cliente_id not in clientes:
+            error = "Cliente no encontrado"
+        elif not prestamo:
+            error = "Préstamo no encontrado"
+        elif pago.monto_pagado <= 0:
+            error = "El monto pagado debe ser mayor a 0"
+        elif prestamo.estado == "Pagado":
+            error = "Este préstamo ya está pagado"
+        elif pago.monto_pagado > prestamo.monto_restante:
+            error = f"El pago supera el saldo restante. Saldo: {prestamo.monto_restante}"
+
+        if error:
+            resultados.append({"indice": indice, "ok": False, "error": error})
+            continue
+
+        fecha_pago = pago.fecha_pago or hoy
+        filas.append({
+            "cliente_id": pago.cliente_id,
+            "prestamo_id": pago.prestamo_id,
+            "monto_pagado": pago.monto_pagado,
+            "fecha_pago": fecha_pago,
+            "estado": "Completado"
+        })
+
+        # Los pagos del mismo préstamo se aplican en orden sobre el saldo en memoria
+        prestamo.monto_pagado += pago.monto_pagado
+        prestamo.monto_restante = (prestamo.monto_inicial + prestamo.total_interes) - prestamo.monto_pagado
+        if prestamo.monto_restante <= 0:
+            prestamo.estado = "Pagado"
+
+        mes = meses.setdefault((fecha_pago.year, fecha_pago.month), [0, 0.0])
+        mes[0] += 1
+        mes[1] += pago.monto_pagado
+
+        resultados.append({
+            "indice": indice,
+            "ok": True,
+            "prestamo_id": prestamo.id,
+            "saldo_restante": prestamo.monto_restante
+        })
+
+    for prestamo in prestamos.values():
+        if prestamo.estado != "Pagado" and prestamo in db.dirty:
+            prestamo.estado = "Atrasado" if hoy > prestamo.fecha_limite else "Activo"
+
+    if filas:
+        # El INSERT multi-fila no pasa por los eventos del ORM: el acumulado mensual y la versión
+        # se registran para el flush, que los aplica en el mismo orden que un pago individual
+        # (resumen_cartera → pagos_mensuales → versiones_tablas)
+        resumen.registrar_meses(db, meses)
+        cache.registrar_cambio(db, Pago.__tablename__)
+        db.flush()
+        db.execute(insert(Pago.__table__), filas)
+
+    db.commit()
+
+    return {
+        "recibidos": len(pagos),
+        "registrados": len(filas),
+        "rechazados": len(pagos) - len(filas),
+        "resultados": resultados
+    }
+
+
+# ✅ MARCAR PRÉSTAMOS ATRASADOS (UPDATE por conjuntos, sin cargar objetos)
+def marcar_atrasados(db: Session, hoy: date = None):
+    hoy = hoy or date.today()
+    vencidos = (Prestamo.monto_restante > 0, Prestamo.fecha_limite < hoy)
+
+    activos = db.execute(
+        update(Prestamo)
+        .where(*vencidos, Prestamo.estado == "Activo")
+        .values(estado="Atrasado")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    otros = db.execute(
+        update(Prestamo)
+        .where(*vencidos, or_(Prestamo.estado.notin_(["Activo", "Atrasado"]), Prestamo.estado.is_(None)))
+        .values(estado="Atrasado")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    # El UPDATE no pasa por los eventos del ORM: se ajustan el resumen y la caché aquí
+    if otros:
+        resumen.recalcular(db)
+    elif activos:
+        resumen.ajustar(db, {"prestamos_activos": -activos, "prestamos_atrasados": activos})
+
+    if activos or otros:
+        cache.marcar_cambio(db, Prestamo.__tablename__)
+
+    db.commit()
+    return activos + otros
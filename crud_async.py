@@ -0,0 +1,46 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from models import Cliente, Prestamo, Pago
+from crud import CARGA_PAGO
+from utils import proyeccion
+import resumen
+
+# ✅ Versiones asíncronas de las lecturas más usadas (activas con DB_ASYNC=1).
+# En AsyncSession no hay carga perezosa: toda relación que se serializa se carga aquí.
+
+
+# ✅ LISTAR CLIENTES
+async def obtener_clientes(db: AsyncSession):
+    return (await db.scalars(select(Cliente))).all()
+
+
+# ✅ OBTENER CLIENTE POR ID
+async def obtener_cliente_por_id(db: AsyncSession, cliente_id: int):
+    return await db.get(Cliente, cliente_id)
+
+
+# ✅ LISTAR PRÉSTAMOS (CON NOMBRE DEL CLIENTE)
+async def listar_prestamos(db: AsyncSession):
+    return (await db.scalars(select(Prestamo).options(joinedload(Prestamo.cliente)))).all()
+
+
+# ✅ OBTENER PRÉSTAMO
+async def obtener_prestamo(db: AsyncSession, prestamo_id: int):
+    return await db.get(Prestamo, prestamo_id, options=[joinedload(Prestamo.cliente)])
+
+
+# ✅ LISTAR PAGOS (misma estrategia de carga que la versión síncrona)
+async def listar_pagos(db: AsyncSession):
+    return (await db.scalars(select(Pago).options(*CARGA_PAGO))).all()
+
+
+# ✅ RESUMEN DEL DASHBOARD (reutiliza la lógica síncrona sobre la misma conexión)
+async def obtener_resumen(db: AsyncSession):
+    return await db.run_sync(resumen.obtener)
+
+
+# ✅ SELECCIÓN DISPERSA (?fields= / ?expand=)
+async def seleccion_dispersa(db: AsyncSession, modelo, relaciones, fields=None, expand=None):
+    consulta, armar = proyeccion(modelo, relaciones, fields, expand)
+    return armar(await db.execute(consulta))
@@ -1,22 +1,197 @@
-from sqlalchemy import create_engine
+import os
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+import metricas
 
-# Parámetros de conexión
-MYSQL_USER = "root"
-MYSQL_PASSWORD = "root123"  # cámbiala si es diferente
-MYSQL_HOST = "localhost"
-MYSQL_PORT = "3306"
-MYSQL_DB = "backend_db"
+# Parámetros de conexión (se pueden sobrescribir con variables de entorno)
+MYSQL_USER = os.getenv("MYSQL_USER", "root")
+MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "root123")  # cámbiala si es diferente
+MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
+MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
+MYSQL_DB = os.getenv("MYSQL_DB", "backend_db")
+
+# URL de conexión (DATABASE_URL tiene prioridad, p. ej. sqlite:///./local.db)
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
+)
+
+# Réplica de solo lectura opcional (sin ella, las lecturas van a la primaria)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+REPLICA_LAG_SEGUNDOS = float(os.getenv("REPLICA_LAG_SEGUNDOS", 5))  # ventana de "leer lo propio"
+
+# Configuración del pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # menor que wait_timeout de MySQL
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+
+# ✅ Pool que mide cuánto espera cada petición por una conexión
+class QueuePoolMedido(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metricas_lock = threading.Lock()
+        self.metricas = {"esperas": 0, "espera_total_s": 0.0, "espera_max_s": 0.0, "timeouts": 0}
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self.metricas_lock:
+                self.metricas["timeouts"] += 1
+            raise
+        finally:
+            espera = time.perf_counter() - inicio
+            with self.metricas_lock:
+                self.metricas["esperas"] += 1
+                self.metricas["espera_total_s"] += espera
+                self.metricas["espera_max_s"] = max(self.metricas["espera_max_s"], espera)
+
+    def recreate(self):
+        # El pool recreado (dispose/reconexión) conserva las métricas acumuladas
+        nuevo = super().recreate()
+        nuevo.metricas = self.metricas
+        nuevo.metricas_lock = self.metricas_lock
+        return nuevo
+
+
+def opciones_pool(url):
+    # SQLite usa sus propios pools; los parámetros de QueuePool solo aplican a servidores
+    if make_url(url).get_backend_name() == "sqlite":
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "poolclass": QueuePoolMedido,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
 
-# URL de conexión
-DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
 
 # Crear el motor de conexión
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **opciones_pool(DATABASE_URL))
+
+# ✅ Motor asíncrono opcional (aiomysql en MySQL, aiosqlite en local)
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+DRIVERS_ASYNC = {"mysql": "mysql+aiomysql", "sqlite": "sqlite+aiosqlite"}
+
+
+def url_async(url):
+    url = make_url(url)
+    return url.set(drivername=DRIVERS_ASYNC.get(url.get_backend_name(), url.drivername))
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or url_async(DATABASE_URL)
+ASYNC_DATABASE_REPLICA_URL = os.getenv("ASYNC_DATABASE_REPLICA_URL") or (
+    url_async(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+)
+
+async_engine = None
+AsyncSessionLocal = None
+async_replica_engine = None
+AsyncReplicaSessionLocal = None
+
+
+def _crear_async_engine(url):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    opciones = {k: v for k, v in opciones_pool(url).items() if k != "poolclass"}
+    return create_async_engine(url, **opciones)
+
+
+def configurar_async(url=None, url_replica=None):
+    global async_engine, AsyncSessionLocal, async_replica_engine, AsyncReplicaSessionLocal
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine = _crear_async_engine(url or ASYNC_DATABASE_URL)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    # Réplica asíncrona con el mismo respaldo que la síncrona: sin réplica, la primaria
+    url_replica = url_replica or ASYNC_DATABASE_REPLICA_URL
+    async_replica_engine = _crear_async_engine(url_replica) if url_replica else None
+    AsyncReplicaSessionLocal = (
+        async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=False, info={"replica": True})
+        if async_replica_engine else AsyncSessionLocal
+    )
+    return async_engine
+
+
+if DB_ASYNC:
+    configurar_async()
+
+# ✅ Consultas y tiempo en la base por petición (todos los motores, incluido el asíncrono)
+@event.listens_for(Engine, "before_cursor_execute")
+def _inicio_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _fin_consulta(conn, cursor, statement, parameters, context, executemany):
+    metricas.registrar_consulta(time.perf_counter() - conn.info["inicio_consulta"].pop())
+
+
+# Una sentencia que falla no llega a after_cursor_execute: se saca su inicio de la pila
+# (si no, la conexión del pool la arrastraría y desfasaría las mediciones siguientes)
+@event.listens_for(Engine, "handle_error")
+def _error_consulta(contexto):
+    conn = contexto.connection
+    pila = conn.info.get("inicio_consulta") if conn is not None and contexto.execution_context is not None else None
+    if pila:
+        metricas.registrar_consulta(time.perf_counter() - pila.pop())
 
 # Crear la sesión
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# ✅ Motor y sesión de la réplica (dashboard, reportes y listados)
+replica_engine = create_engine(DATABASE_REPLICA_URL, **opciones_pool(DATABASE_REPLICA_URL)) if DATABASE_REPLICA_URL else None
+ReplicaSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, bind=replica_engine, info={"replica": True})
+    if replica_engine else SessionLocal
+)
+
+
+@event.listens_for(Session, "before_flush")
+def _bloquear_escrituras_replica(session, flush_context, instances):
+    if session.info.get("replica") and (session.new or session.dirty or session.deleted):
+        raise RuntimeError("La sesión de la réplica es de solo lectura; use get_db para escribir")
+
 # Base declarativa
 Base = declarative_base()
+
+
+# ✅ Estado del pool: conexiones en uso, libres, overflow y tiempos de espera
+def estadisticas_pool(motor=None):
+    pool = (motor or engine).pool
+    datos = {"tipo": type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        datos.update({
+            "tamano": pool.size(),
+            "en_uso": pool.checkedout(),
+            "libres": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "timeout_s": DB_POOL_TIMEOUT,
+        })
+
+    metricas = getattr(pool, "metricas", None)
+    if metricas is not None:
+        with pool.metricas_lock:
+            esperas = metricas["esperas"]
+            datos.update({
+                "esperas": esperas,
+                "espera_promedio_ms": round(metricas["espera_total_s"] / esperas * 1000, 3) if esperas else 0.0,
+                "espera_max_ms": round(metricas["espera_max_s"] * 1000, 3),
+                "timeouts": metricas["timeouts"],
+            })
+
+    return datos
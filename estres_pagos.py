@@ -0,0 +1,97 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from fastapi import HTTPException
+from sqlalchemy import func
+from database import SessionLocal
+from models import Cliente, Prestamo, Pago
+import crud
+import schemas
+
+# Prueba de estrés de crear_pago: muchos clientes pagando el mismo préstamo a la vez.
+# Crea sus propios registros y los borra al terminar (usar una base de pruebas).
+HILOS = int(os.getenv("ESTRES_HILOS", 16))
+PAGOS_POR_HILO = int(os.getenv("ESTRES_PAGOS_POR_HILO", 50))
+
+
+def crear_prestamo(db, cliente_id, saldo):
+    hoy = date.today()
+    prestamo = Prestamo(
+        cliente_id=cliente_id, monto_inicial=saldo, total_interes=0, monto_pagado=0,
+        monto_restante=saldo, estado="Activo", fecha_inicio=hoy, fecha_limite=hoy + timedelta(days=30)
+    )
+    db.add(prestamo)
+    db.commit()
+    return prestamo.id
+
+
+def pagar(cliente_id, prestamo_id, monto, veces):
+    aceptados = rechazados = 0
+    db = SessionLocal()
+    try:
+        for _ in range(veces):
+            try:
+                crud.crear_pago(db, schemas.PagoCreate(cliente_id=cliente_id, prestamo_id=prestamo_id, monto_pagado=monto))
+                aceptados += 1
+            except HTTPException:
+                rechazados += 1
+    finally:
+        db.close()
+    return aceptados, rechazados
+
+
+def ejecutar(cliente_id, prestamo_id, monto, veces):
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=HILOS) as pool:
+        resultados = list(pool.map(lambda _: pagar(cliente_id, prestamo_id, monto, veces), range(HILOS)))
+    duracion = time.perf_counter() - inicio
+    return sum(a for a, _ in resultados), sum(r for _, r in resultados), duracion
+
+
+def verificar(db, prestamo_id, saldo_inicial, aceptados, monto):
+    db.expire_all()
+    prestamo = db.query(Prestamo).filter(Prestamo.id == prestamo_id).one()
+    cantidad, total = db.query(func.count(Pago.id), func.coalesce(func.sum(Pago.monto_pagado), 0)).filter(
+        Pago.prestamo_id == prestamo_id
+    ).one()
+    esperado = aceptados * monto
+    ok = (
+        cantidad == aceptados
+        and abs(total - esperado) < 1e-6
+        and abs(prestamo.monto_pagado - esperado) < 1e-6
+        and abs(prestamo.monto_restante - (saldo_inicial - esperado)) < 1e-6
+    )
+    print(f"  Pagos: {cantidad}, pagado: {prestamo.monto_pagado}, restante: {prestamo.monto_restante}, estado: {prestamo.estado}")
+    print(f"  Saldos consistentes: {'✅' if ok else '❌'}")
+    return ok
+
+
+db = SessionLocal()
+cliente = Cliente(nombre="Estrés crear_pago", cedula=f"estres-{time.time_ns()}", monto=0)
+db.add(cliente)
+db.commit()
+
+try:
+    # 1) Rendimiento: saldo suficiente para todos los pagos
+    total_pagos = HILOS * PAGOS_POR_HILO
+    prestamo_id = crear_prestamo(db, cliente.id, total_pagos * 1.0 + 1)
+    aceptados, rechazados, duracion = ejecutar(cliente.id, prestamo_id, 1.0, PAGOS_POR_HILO)
+    print(f"{HILOS} hilos x {PAGOS_POR_HILO} pagos sobre un mismo préstamo")
+    print(f"  Aceptados: {aceptados}, rechazados: {rechazados}, {aceptados / duracion:.0f} pagos/s")
+    ok = verificar(db, prestamo_id, total_pagos * 1.0 + 1, aceptados, 1.0) and aceptados == total_pagos
+
+    # 2) Carrera por el saldo: 10 pagos caben, el resto debe rechazarse sin sobregirar
+    prestamo_id = crear_prestamo(db, cliente.id, 100.0)
+    aceptados, rechazados, _ = ejecutar(cliente.id, prestamo_id, 10.0, 3)
+    print(f"{HILOS * 3} pagos de 10 contra un saldo de 100")
+    print(f"  Aceptados: {aceptados}, rechazados: {rechazados}")
+    ok = verificar(db, prestamo_id, 100.0, aceptados, 10.0) and ok and aceptados == min(10, HILOS * 3)
+finally:
+    db.expire_all()
+    db.delete(db.query(Cliente).filter(Cliente.id == cliente.id).one())
+    db.commit()
+    db.close()
+
+print("\n✅ Prueba superada" if ok else "\n❌ Prueba fallida")
+raise SystemExit(0 if ok else 1)
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from pydantic import BaseModel
+from sqlalchemy import event, select, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import ClaveIdempotencia
+from utils import CacheLRU
+
+# Respuestas guardadas por Idempotency-Key (por usuario y ruta), con vencimiento
+IDEMPOTENCIA_TTL_SEGUNDOS = int(os.getenv("IDEMPOTENCIA_TTL_SEGUNDOS", 86400))
+IDEMPOTENCIA_MAX = int(os.getenv("IDEMPOTENCIA_MAX", 100000))
+# Pasado este tiempo, una clave sin respuesta guardada ya no está "en proceso": la petición
+# original confirmó y murió antes de guardarla, y la respuesta se rehace desde el recurso
+IDEMPOTENCIA_EN_CURSO_SEGUNDOS = int(os.getenv("IDEMPOTENCIA_EN_CURSO_SEGUNDOS", 30))
+LONGITUD_MAX_CLAVE = 255
+
+# La fuente de verdad es claves_idempotencia (UNIQUE por ámbito, usuario y clave);
+# esta caché solo evita la consulta cuando el reintento llega al mismo proceso
+respuestas = CacheLRU(IDEMPOTENCIA_MAX, IDEMPOTENCIA_TTL_SEGUNDOS)
+
+_tabla = ClaveIdempotencia.__table__
+
+
+class ClaveEnUso(Exception):
+    """Otra petición con la misma clave confirmó su escritura primero."""
+
+
+def _huella(cuerpo: BaseModel):
+    datos = json.dumps(cuerpo.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(datos.encode()).hexdigest()[:32]
+
+
+def _serializar(resultado):
+    return json.dumps(jsonable_encoder(resultado), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _respuesta(contenido: bytes, repetida: bool):
+    return Response(
+        content=contenido,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true" if repetida else "false"},
+    )
+
+
+def _vigencia():
+    return datetime.now() - timedelta(seconds=IDEMPOTENCIA_TTL_SEGUNDOS)
+
+
+def _condicion(clave):
+    ambito, usuario_id, idempotency_key = clave
+    return (_tabla.c.ambito == ambito, _tabla.c.usuario_id == usuario_id, _tabla.c.clave == idempotency_key)
+
+
+def _repetir(huella, huella_guardada, contenido):
+    if huella_guardada != huella:
+        raise HTTPException(status_code=422, detail="Idempotency-Key ya usada con un cuerpo diferente")
+    if contenido is None:
+        # La escritura ya confirmó pero su respuesta aún no se guarda
+        raise HTTPException(status_code=409, detail="Ya hay una solicitud en proceso con esta Idempotency-Key")
+    return _respuesta(contenido, repetida=True)
+
+
+def _rehacer(db: Session, clave, fila, modelo, esquema):
+    # Solo si la petición original ya no puede estar guardándola (y se sabe qué creó)
+    en_curso = fila.creada >= datetime.now() - timedelta(seconds=IDEMPOTENCIA_EN_CURSO_SEGUNDOS)
+    if en_curso or fila.recurso_id is None or esquema is None:
+        return None
+    recurso = db.get(modelo, fila.recurso_id)
+    if recurso is None:
+        return None
+
+    # Refleja el estado actual del recurso (p. ej. el saldo tras pagos posteriores)
+    contenido = _serializar(esquema.model_validate(recurso))
+    db.execute(
+        update(_tabla).where(*_condicion(clave), _tabla.c.respuesta.is_(None)).values(respuesta=contenido.decode())
+    )
+    db.commit()
+    return contenido
+
+
+def _buscar(db: Session, clave, modelo=None, esquema=None):
+    fila = db.execute(
+        select(_tabla.c.huella, _tabla.c.respuesta, _tabla.c.creada, _tabla.c.recurso_id).where(*_condicion(clave))
+    ).first()
+    if fila is None:
+        return None
+    if fila.creada < _vigencia():
+        # Vencida: se libera para que la clave pueda volver a usarse
+        db.execute(delete(_tabla).where(*_condicion(clave), _tabla.c.creada < _vigencia()))
+        db.commit()
+        return None
+    if fila.respuesta is None:
+        return fila.huella, _rehacer(db, clave, fila, modelo, esquema)
+    return fila.huella, fila.respuesta.encode()
+
+
+# Anota el id del recurso creado por la operación (p. ej. el Pago) junto a la clave
+@event.listens_for(Session, "after_flush")
+def _anotar_recurso(session, flush_context):
+    pendiente = session.info.get("idempotencia")
+    modelo = session.info.get("idempotencia_modelo")
+    if not pendiente or modelo is None:
+        return
+    for obj in session.new:
+        if isinstance(obj, modelo):
+            pendiente["recurso_id"] = obj.id
+
+
+# ✅ La clave se inserta en la misma transacción que la escritura (en su COMMIT):
+# si otra petición con la misma clave confirmó antes, la UNIQUE revierte esta escritura
+@event.listens_for(Session, "before_commit")
+def _registrar_clave(session):
+    pendiente = session.info.get("idempotencia")
+    if not pendiente or session.info.get("idempotencia_registrada"):
+        return
+    # Flush previo: el recurso necesita su id antes de insertar la clave
+    session.flush()
+    try:
+        session.execute(insert(_tabla).values(**pendiente, creada=datetime.now()))
+    except IntegrityError as e:
+        raise ClaveEnUso() from e
+    session.info["idempotencia_registrada"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _confirmar_clave(session):
+    if session.info.pop("idempotencia_registrada", False):
+        session.info.pop("idempotencia", None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_clave(session):
+    # Los reintentos de la operación (p. ej. por deadlock) vuelven a insertarla
+    session.info.pop("idempotencia_registrada", None)
+    pendiente = session.info.get("idempotencia")
+    if pendiente:
+        pendiente.pop("recurso_id", None)
+
+
+# ✅ Ejecuta la operación una sola vez por clave; los reintentos reciben la misma respuesta.
+# modelo y esquema permiten rehacer la respuesta si la petición original no llegó a guardarla
+def ejecutar(db: Session, idempotency_key, ambito, usuario_id, cuerpo: BaseModel, operacion, modelo=None, esquema=None):
+    if idempotency_key is None:
+        return operacion()
+
+    if not idempotency_key or len(idempotency_key) > LONGITUD_MAX_CLAVE:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key debe tener entre 1 y {LONGITUD_MAX_CLAVE} caracteres")
+
+    clave = (ambito, usuario_id, idempotency_key)
+    huella = _huella(cuerpo)
+
+    guardada = respuestas.obtener(clave) or _buscar(db, clave, modelo, esquema)
+    if guardada is not None:
+        return _repetir(huella, *guardada)
+
+    db.info["idempotencia"] = {"ambito": ambito, "usuario_id": usuario_id, "clave": idempotency_key, "huella": huella}
+    db.info["idempotencia_modelo"] = modelo
+    try:
+        resultado = operacion()
+    except ClaveEnUso:
+        db.rollback()
+        guardada = _buscar(db, clave, modelo, esquema)
+        if guardada is None:
+            raise HTTPException(status_code=409, detail="Ya hay una solicitud en proceso con esta Idempotency-Key")
+        return _repetir(huella, *guardada)
+    finally:
+        db.info.pop("idempotencia", None)
+        db.info.pop("idempotencia_modelo", None)
+
+    # Solo se guardan los éxitos: ante un error no hay fila y el cliente puede reintentar
+    contenido = _serializar(resultado)
+    guardado = db.execute(update(_tabla).where(*_condicion(clave)).values(respuesta=contenido.decode())).rowcount
+    if not guardado:
+        db.execute(insert(_tabla).values(
+            ambito=ambito, usuario_id=usuario_id, clave=idempotency_key, huella=huella,
+            respuesta=contenido.decode(), creada=datetime.now()
+        ))
+    db.commit()
+    respuestas.guardar(clave, (huella, contenido))
+
+    return _respuesta(contenido, repetida=False)
+
+
+# ✅ Purga de claves vencidas (programador de tareas)
+def purgar(db: Session):
+    borradas = db.execute(delete(_tabla).where(_tabla.c.creada < _vigencia())).rowcount
+    db.commit()
+    return borradas
@@ -0,0 +1,152 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import select, insert, update, delete, func
+import cache
+import database
+import reportes
+from models import TrabajoReporte
+
+# Configuración del pool de reportes
+REPORTES_WORKERS = int(os.getenv("REPORTES_WORKERS", min(4, os.cpu_count() or 1)))
+REPORTES_MAX_PENDIENTES = int(os.getenv("REPORTES_MAX_PENDIENTES", 32))
+REPORTES_TTL_SEGUNDOS = int(os.getenv("REPORTES_TTL_SEGUNDOS", 3600))
+# Con varios workers (o servidores) debe ser un directorio compartido por todos
+REPORTES_JOBS_DIR = os.getenv("REPORTES_JOBS_DIR", os.path.join(tempfile.gettempdir(), "reportes_jobs"))
+
+# El estado de cada trabajo vive en trabajos_reporte: cualquier worker puede consultarlo y
+# servir la descarga; el pool de procesos sí es de cada worker
+_pool = None
+_lock = threading.Lock()
+_tabla = TrabajoReporte.__table__
+
+
+def _inicializar_worker():
+    # Tras un fork el proceso hijo no debe reutilizar las conexiones del padre
+    from database import engine, replica_engine
+    engine.dispose(close=False)
+    if replica_engine is not None:
+        replica_engine.dispose(close=False)
+
+
+def _obtener_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            os.makedirs(REPORTES_JOBS_DIR, exist_ok=True)
+            _pool = ProcessPoolExecutor(max_workers=REPORTES_WORKERS, initializer=_inicializar_worker)
+        return _pool
+
+
+def _actualizar(job_id, **valores):
+    with database.engine.begin() as conexion:
+        conexion.execute(update(_tabla).where(_tabla.c.id == job_id).values(**valores))
+
+
+# ✅ Punto de entrada en el proceso de trabajo: genera el archivo y registra el resultado
+def _ejecutar(job_id, tipo, formato, ruta):
+    _actualizar(job_id, estado="procesando")
+    try:
+        filas = reportes.generar_reporte(tipo, formato, ruta)
+    except Exception as e:
+        _actualizar(job_id, estado="error", error=str(e) or e.__class__.__name__)
+        raise
+    _actualizar(job_id, estado="listo", filas=filas)
+    return filas
+
+
+def _limpiar_vencidos():
+    with database.engine.begin() as conexion:
+        vencidos = conexion.execute(
+            select(_tabla.c.id, _tabla.c.ruta).where(_tabla.c.vence < datetime.now())
+        ).all()
+        for job_id, ruta in vencidos:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        if vencidos:
+            conexion.execute(delete(_tabla).where(_tabla.c.id.in_([job_id for job_id, _ in vencidos])))
+
+
+def _guardar_en_cache(ruta, clave, extension):
+    def callback(futuro):
+        if futuro.cancelled() or futuro.exception():
+            return
+        # Copia: la ruta del trabajo sigue siendo válida mientras se descarga
+        temporal = cache.ruta_temporal(extension)
+        shutil.copyfile(ruta, temporal)
+        cache.guardar(clave, temporal, extension)
+    return callback
+
+
+# ✅ Encolar un reporte (o devolverlo ya listo si está en caché)
+def enviar(tipo, formato, usuario_id, clave=None, ruta_cache=None):
+    if tipo not in reportes.REPORTES:
+        raise HTTPException(status_code=400, detail="Tipo de reporte no válido")
+    if formato not in reportes.FORMATOS:
+        raise HTTPException(status_code=400, detail="Formato de reporte no válido")
+
+    _limpiar_vencidos()
+    pool = _obtener_pool()
+    extension = reportes.FORMATOS[formato][0]
+    ahora = datetime.now()
+    job_id = uuid.uuid4().hex
+    ruta = os.path.join(REPORTES_JOBS_DIR, f"{job_id}.{extension}")
+
+    with database.engine.begin() as conexion:
+        if not ruta_cache:
+            pendientes = conexion.execute(
+                select(func.count()).select_from(_tabla).where(_tabla.c.estado.in_(("pendiente", "procesando")))
+            ).scalar()
+            if pendientes >= REPORTES_MAX_PENDIENTES:
+                raise HTTPException(status_code=429, detail="Demasiados reportes en cola, intente más tarde")
+
+        if ruta_cache:
+            # Copia en el directorio compartido: la caché es local a cada worker
+            shutil.copyfile(ruta_cache, ruta)
+
+        conexion.execute(insert(_tabla).values(
+            id=job_id, usuario_id=usuario_id, tipo=tipo, formato=formato,
+            estado="listo" if ruta_cache else "pendiente", ruta=ruta,
+            creado=ahora, vence=ahora + timedelta(seconds=REPORTES_TTL_SEGUNDOS),
+        ))
+
+    if not ruta_cache:
+        futuro = pool.submit(_ejecutar, job_id, tipo, formato, ruta)
+        if clave:
+            futuro.add_done_callback(_guardar_en_cache(ruta, clave, extension))
+
+    return consultar(job_id, usuario_id)
+
+
+# ✅ Estado de un trabajo (desde cualquier worker)
+def obtener(job_id, usuario_id):
+    with database.engine.connect() as conexion:
+        trabajo = conexion.execute(select(_tabla).where(_tabla.c.id == job_id)).mappings().first()
+    if not trabajo or trabajo["usuario_id"] != usuario_id:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return dict(trabajo)
+
+
+def consultar(job_id, usuario_id):
+    trabajo = obtener(job_id, usuario_id)
+    return {
+        "id": trabajo["id"],
+        "tipo": trabajo["tipo"],
+        "formato": trabajo["formato"],
+        "estado": trabajo["estado"],
+        "filas": trabajo["filas"] if trabajo["estado"] == "listo" else None,
+        "error": trabajo["error"] if trabajo["estado"] == "error" else None,
+    }
+
+
+def cerrar():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
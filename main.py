@@ -1,16 +1,23 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from routers import reports
 
 
 
-from database import engine
-from models import Base
+import database
+from database import engine, SessionLocal
+import auth
+import jobs
+import metricas
+import migraciones
+import resumen
+import tareas
 
 # ✅ Importar Routers
 from routers.auth_routes import router as auth_router
-from routers import clients, loans, payments, dashboard_routes
+from routers import clients, loans, payments, dashboard_routes, health, metrics
 # from routers import reports  # <-- Si tienes reports, descomenta
 
 # ✅ Crear la app
@@ -28,8 +35,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ✅ Crear tablas
-Base.metadata.create_all(bind=engine)
+# ✅ Latencia, consultas SQL y tiempo en la base por ruta (expuestos en /metrics)
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    consultas = metricas.iniciar_peticion()
+    inicio = time.perf_counter()
+    estado = 500
+    try:
+        respuesta = await call_next(request)
+        estado = respuesta.status_code
+        return respuesta
+    finally:
+        # Plantilla de la ruta ("/prestamos/{prestamo_id}") para no multiplicar las series
+        ruta = request.scope.get("route")
+        metricas.registrar_peticion(
+            request.method, ruta.path if ruta else "sin_ruta", estado,
+            time.perf_counter() - inicio, consultas
+        )
+
+# ✅ Leer lo propio: tras una escritura exitosa, ese cliente lee de la primaria un momento
+@app.middleware("http")
+async def marcar_escrituras(request: Request, call_next):
+    respuesta = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and respuesta.status_code < 400:
+        auth.registrar_escritura(request)
+    return respuesta
+
+# ✅ Origen de cada lectura (primaria o réplica), incluso si el endpoint devuelve su propia Response
+@app.middleware("http")
+async def origen_lectura(request: Request, call_next):
+    respuesta = await call_next(request)
+    origen = getattr(request.state, "origen_lectura", None)
+    if origen:
+        respuesta.headers["X-Origen-Lectura"] = origen
+    return respuesta
+
+# ✅ Esquema versionado (tablas e índices; ver migraciones.py)
+migraciones.migrar(engine)
+
+# ✅ Inicializar resumen del dashboard y acumulado de pagos por mes
+with SessionLocal() as db:
+    resumen.inicializar(db)
+
+# ✅ Programador de tareas de mantenimiento (atrasados, reconciliación)
+@app.on_event("startup")
+def iniciar_tareas():
+    tareas.iniciar()
+
+
+# ✅ Cerrar los pools de procesos al apagar
+@app.on_event("shutdown")
+def cerrar_pools():
+    tareas.detener()
+    jobs.cerrar()
+    auth.cerrar_hash_pool()
+
+
+@app.on_event("shutdown")
+async def cerrar_motor_async():
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+    if database.async_replica_engine is not None:
+        await database.async_replica_engine.dispose()
 
 # ✅ Swagger + JWT
 def custom_openapi():
@@ -67,6 +134,8 @@ app.include_router(loans.router)
 app.include_router(payments.router)
 app.include_router(dashboard_routes.router)
 app.include_router(reports.router)
+app.include_router(health.router)
+app.include_router(metrics.router)
 
 # ✅ Si tienes reports, solo así:
 # app.include_router(reports.router)
@@ -0,0 +1,128 @@
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# Límites de los histogramas (segundos y número de consultas)
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class ConsultasPeticion:
+    """Acumulador por petición; lo alimentan los eventos del motor sin bloqueos."""
+    __slots__ = ("cantidad", "segundos")
+
+    def __init__(self):
+        self.cantidad = 0
+        self.segundos = 0.0
+
+
+# La petición en curso (se hereda en el threadpool de los endpoints síncronos)
+peticion_actual: ContextVar = ContextVar("metricas_peticion", default=None)
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, limites, etiquetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.limites = limites
+        self.etiquetas = etiquetas
+        self.series = {}  # valores de etiquetas -> [conteos por bucket..., suma, total]
+
+    def observar(self, valores, valor):
+        serie = self.series.get(valores)
+        if serie is None:
+            serie = self.series[valores] = [0] * (len(self.limites) + 1) + [0.0, 0]
+        serie[bisect_left(self.limites, valor)] += 1
+        serie[-2] += valor
+        serie[-1] += 1
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for valores, serie in sorted(self.series.items()):
+            base = _etiquetas(self.etiquetas, valores)
+            acumulado = 0
+            for limite, conteo in zip(self.limites + ("+Inf",), serie):
+                acumulado += conteo
+                lineas.append(f'{self.nombre}_bucket{{{base},le="{limite}"}} {acumulado}')
+            lineas.append(f"{self.nombre}_sum{{{base}}} {serie[-2]}")
+            lineas.append(f"{self.nombre}_count{{{base}}} {serie[-1]}")
+        return lineas
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.series = {}
+
+    def sumar(self, valores=(), valor=1):
+        self.series[valores] = self.series.get(valores, 0) + valor
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        for valores, total in sorted(self.series.items()):
+            base = _etiquetas(self.etiquetas, valores)
+            lineas.append(f"{self.nombre}{{{base}}} {total}" if base else f"{self.nombre} {total}")
+        return lineas
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(nombres, valores):
+    return ",".join(f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores))
+
+
+_lock = threading.Lock()
+
+peticiones_total = Contador("http_peticiones_total", "Peticiones atendidas", ("metodo", "ruta", "estado"))
+latencia = Histograma("http_latencia_segundos", "Latencia por ruta", BUCKETS_SEGUNDOS, ("metodo", "ruta"))
+consultas_peticion = Histograma("db_consultas_por_peticion", "Consultas SQL por petición", BUCKETS_CONSULTAS, ("metodo", "ruta"))
+tiempo_db = Histograma("db_tiempo_por_peticion_segundos", "Tiempo en la base por petición", BUCKETS_SEGUNDOS, ("metodo", "ruta"))
+consultas_total = Contador("db_consultas_total", "Consultas SQL ejecutadas", ("origen",))
+tiempo_db_total = Contador("db_tiempo_segundos_total", "Tiempo total en la base", ("origen",))
+
+
+# ✅ Ganchos usados por el middleware y los eventos del motor
+def iniciar_peticion():
+    consultas = ConsultasPeticion()
+    peticion_actual.set(consultas)
+    return consultas
+
+
+def registrar_consulta(segundos):
+    consultas = peticion_actual.get()
+    if consultas is not None:
+        consultas.cantidad += 1
+        consultas.segundos += segundos
+        return
+    # Tareas programadas, trabajos y arranque: solo totales
+    with _lock:
+        consultas_total.sumar(("fondo",))
+        tiempo_db_total.sumar(("fondo",), segundos)
+
+
+def registrar_peticion(metodo, ruta, estado, segundos, consultas):
+    with _lock:
+        peticiones_total.sumar((metodo, ruta, str(estado)))
+        latencia.observar((metodo, ruta), segundos)
+        consultas_peticion.observar((metodo, ruta), consultas.cantidad)
+        tiempo_db.observar((metodo, ruta), consultas.segundos)
+        consultas_total.sumar(("peticion",), consultas.cantidad)
+        tiempo_db_total.sumar(("peticion",), consultas.segundos)
+
+
+def gauge(nombre, ayuda, valor):
+    return [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge", f"{nombre} {valor}"]
+
+
+# ✅ Formato de texto de Prometheus
+def exportar(extras=()):
+    with _lock:
+        lineas = []
+        for metrica in (peticiones_total, latencia, consultas_peticion, tiempo_db, consultas_total, tiempo_db_total):
+            lineas.extend(metrica.exportar())
+    lineas.extend(extras)
+    return "\n".join(lineas) + "\n"
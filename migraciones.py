@@ -0,0 +1,161 @@
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, Text, UniqueConstraint, Index, select, insert, text, inspect
+import database
+import models  # registra los modelos en Base.metadata para la v1
+
+# Tabla de control, fuera de Base para que no dependa de los modelos
+_control = MetaData()
+schema_version = Table(
+    "schema_version",
+    _control,
+    Column("version", Integer, primary_key=True),
+    Column("descripcion", String(200), nullable=False),
+    Column("aplicada", DateTime, nullable=False),
+)
+
+
+# ✅ Migraciones (en orden; nunca se modifica una ya publicada, se agrega otra)
+def _v1_esquema_inicial(conexion):
+    # Equivale al create_all anterior: en bases existentes no hace nada
+    database.Base.metadata.create_all(conexion)
+
+
+def _crear_indice(conexion, tabla, nombre, columnas):
+    # Cada migración fija sus propios índices: no depende de lo que declare models.py hoy
+    existentes = {i["name"] for i in inspect(conexion).get_indexes(tabla)}
+    if nombre not in existentes:
+        conexion.execute(text(f"CREATE INDEX {nombre} ON {tabla} ({', '.join(columnas)})"))
+
+
+def _v2_indices_consultas(conexion):
+    for tabla, nombre, columnas in (
+        ("prestamos", "ix_prestamos_estado_fecha_limite", ("estado", "fecha_limite")),
+        ("prestamos", "ix_prestamos_cliente_estado", ("cliente_id", "estado")),
+        ("prestamos", "ix_prestamos_fecha_limite", ("fecha_limite",)),
+        ("pagos", "ix_pagos_fecha_pago_id", ("fecha_pago", "id")),
+        ("pagos", "ix_pagos_cliente_fecha", ("cliente_id", "fecha_pago")),
+        ("pagos", "ix_pagos_prestamo_fecha", ("prestamo_id", "fecha_pago")),
+    ):
+        _crear_indice(conexion, tabla, nombre, columnas)
+
+
+def _v3_indice_cubriente_saldo(conexion):
+    # (estado, fecha_limite, monto_restante) reemplaza a (estado, fecha_limite): mismo prefijo
+    # y la cartera/flujo de caja suman el saldo solo desde el índice
+    _crear_indice(conexion, "prestamos", "ix_prestamos_estado_limite_saldo", ("estado", "fecha_limite", "monto_restante"))
+
+    existentes = {i["name"] for i in inspect(conexion).get_indexes("prestamos")}
+    if "ix_prestamos_estado_fecha_limite" in existentes:
+        tabla = " ON prestamos" if conexion.dialect.name == "mysql" else ""
+        conexion.execute(text(f"DROP INDEX ix_prestamos_estado_fecha_limite{tabla}"))
+
+
+def _v4_versiones_tablas(conexion):
+    # Definición fija aquí (no la del modelo) para que la migración no cambie con models.py
+    versiones = Table(
+        "versiones_tablas",
+        MetaData(),
+        Column("tabla", String(50), primary_key=True),
+        Column("version", Integer, nullable=False, default=0),
+    )
+    versiones.create(conexion, checkfirst=True)
+
+    existentes = set(conexion.execute(select(versiones.c.tabla)).scalars())
+    nuevas = [{"tabla": t, "version": 0} for t in ("clientes", "prestamos", "pagos") if t not in existentes]
+    if nuevas:
+        conexion.execute(insert(versiones), nuevas)
+
+
+def _v5_claves_idempotencia(conexion):
+    Table(
+        "claves_idempotencia",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("ambito", String(20), nullable=False),
+        Column("usuario_id", Integer, nullable=False),
+        Column("clave", String(255), nullable=False),
+        Column("huella", String(32), nullable=False),
+        Column("respuesta", Text),
+        Column("creada", DateTime, nullable=False),
+        UniqueConstraint("ambito", "usuario_id", "clave", name="uq_claves_idempotencia"),
+        Index("ix_claves_idempotencia_creada", "creada"),
+    ).create(conexion, checkfirst=True)
+
+
+def _v6_trabajos_reporte(conexion):
+    Table(
+        "trabajos_reporte",
+        MetaData(),
+        Column("id", String(32), primary_key=True),
+        Column("usuario_id", Integer, nullable=False),
+        Column("tipo", String(20), nullable=False),
+        Column("formato", String(10), nullable=False),
+        Column("estado", String(20), nullable=False),
+        Column("ruta", String(500), nullable=False),
+        Column("filas", Integer),
+        Column("error", Text),
+        Column("creado", DateTime, nullable=False),
+        Column("vence", DateTime, nullable=False),
+        Index("ix_trabajos_reporte_vence", "vence"),
+    ).create(conexion, checkfirst=True)
+
+
+def _v7_recurso_idempotencia(conexion):
+    # Con el id del recurso creado se puede rehacer una respuesta que nunca llegó a guardarse
+    columnas = {c["name"] for c in inspect(conexion).get_columns("claves_idempotencia")}
+    if "recurso_id" not in columnas:
+        conexion.execute(text("ALTER TABLE claves_idempotencia ADD COLUMN recurso_id INTEGER"))
+
+
+MIGRACIONES = [
+    (1, "Esquema inicial", _v1_esquema_inicial),
+    (2, "Índices de estado, vencimiento, cliente y fecha de pago", _v2_indices_consultas),
+    (3, "Índice cubriente de estado, vencimiento y saldo", _v3_indice_cubriente_saldo),
+    (4, "Versión de datos por tabla para la caché de reportes", _v4_versiones_tablas),
+    (5, "Claves de idempotencia de pagos y préstamos", _v5_claves_idempotencia),
+    (6, "Trabajos de reportes compartidos entre workers", _v6_trabajos_reporte),
+    (7, "Recurso creado por cada clave de idempotencia", _v7_recurso_idempotencia),
+]
+
+
+# ✅ Un solo proceso migra a la vez (varios workers arrancando juntos)
+def _bloquear(conexion):
+    if conexion.dialect.name == "mysql":
+        if conexion.execute(text("SELECT GET_LOCK('migraciones', 60)")).scalar() != 1:
+            raise RuntimeError("No se pudo obtener el bloqueo de migraciones")
+
+
+def _liberar(conexion):
+    if conexion.dialect.name == "mysql":
+        conexion.execute(text("SELECT RELEASE_LOCK('migraciones')"))
+
+
+def version_actual(conexion):
+    _control.create_all(conexion)
+    return conexion.execute(select(schema_version.c.version).order_by(schema_version.c.version.desc())).scalar() or 0
+
+
+def migrar(motor=None):
+    aplicadas = []
+    with (motor or database.engine).connect() as conexion:
+        _bloquear(conexion)
+        try:
+            actual = version_actual(conexion)
+            conexion.commit()
+            for version, descripcion, funcion in MIGRACIONES:
+                if version <= actual:
+                    continue
+                funcion(conexion)
+                conexion.execute(insert(schema_version).values(
+                    version=version, descripcion=descripcion, aplicada=datetime.now()
+                ))
+                conexion.commit()
+                aplicadas.append(version)
+        finally:
+            _liberar(conexion)
+    return aplicadas
+
+
+if __name__ == "__main__":
+    aplicadas = migrar()
+    print(f"✅ Migraciones aplicadas: {aplicadas}" if aplicadas else "✅ El esquema ya está al día")
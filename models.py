@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import date
@@ -36,6 +36,14 @@ class Prestamo(Base):
     cliente = relationship("Cliente", back_populates="prestamos")
     pagos = relationship("Pago", back_populates="prestamo", cascade="all, delete-orphan")
 
+    # ✅ Índices de las consultas reales (se crean con migraciones.py)
+    __table_args__ = (
+        # Conteos por estado, barrido de atrasados; incluye el saldo para cartera y flujo de caja sin leer la tabla
+        Index("ix_prestamos_estado_limite_saldo", "estado", "fecha_limite", "monto_restante"),
+        Index("ix_prestamos_cliente_estado", "cliente_id", "estado"),         # préstamos de un cliente
+        Index("ix_prestamos_fecha_limite", "fecha_limite"),                   # vencimientos por rango de fechas
+    )
+
 
 class Usuario(Base):
     __tablename__ = "usuarios"
@@ -58,3 +66,79 @@ class Pago(Base):
 
     cliente = relationship("Cliente", back_populates="pagos")  # ✅ mejorado
     prestamo = relationship("Prestamo", back_populates="pagos")
+
+    __table_args__ = (
+        Index("ix_pagos_fecha_pago_id", "fecha_pago", "id"),              # rangos de fechas y paginación keyset
+        Index("ix_pagos_cliente_fecha", "cliente_id", "fecha_pago"),      # pagos de un cliente
+        Index("ix_pagos_prestamo_fecha", "prestamo_id", "fecha_pago"),    # pagos de un préstamo
+    )
+
+
+# ✅ Resumen precalculado para las tarjetas del dashboard (una sola fila, id = 1)
+class ResumenCartera(Base):
+    __tablename__ = "resumen_cartera"
+
+    id = Column(Integer, primary_key=True)
+    total_clientes = Column(Integer, nullable=False, default=0)
+    total_prestamos = Column(Integer, nullable=False, default=0)
+    prestamos_activos = Column(Integer, nullable=False, default=0)
+    prestamos_pagados = Column(Integer, nullable=False, default=0)
+    prestamos_atrasados = Column(Integer, nullable=False, default=0)
+    ganancias_interes = Column(Float, nullable=False, default=0)
+
+
+# ✅ Acumulado de pagos por año y mes (para las gráficas del dashboard)
+class PagoMensual(Base):
+    __tablename__ = "pagos_mensuales"
+
+    anio = Column(Integer, primary_key=True)
+    mes = Column(Integer, primary_key=True)
+    cantidad = Column(Integer, nullable=False, default=0)
+    monto = Column(Float, nullable=False, default=0)
+
+
+# ✅ Versión de datos por tabla (clave de la caché de reportes, compartida entre procesos)
+class VersionTabla(Base):
+    __tablename__ = "versiones_tablas"
+
+    tabla = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# ✅ Claves de idempotencia de POST /pagos y POST /prestamos (se insertan con la escritura)
+class ClaveIdempotencia(Base):
+    __tablename__ = "claves_idempotencia"
+
+    id = Column(Integer, primary_key=True)
+    ambito = Column(String(20), nullable=False)
+    usuario_id = Column(Integer, nullable=False)
+    clave = Column(String(255), nullable=False)
+    huella = Column(String(32), nullable=False)  # hash del cuerpo de la petición
+    respuesta = Column(Text)                     # JSON ya renderizado
+    recurso_id = Column(Integer)                 # id del pago/préstamo creado
+    creada = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("ambito", "usuario_id", "clave", name="uq_claves_idempotencia"),
+        Index("ix_claves_idempotencia_creada", "creada"),  # purga de vencidas
+    )
+
+
+# ✅ Trabajos de reportes en segundo plano (visibles para todos los workers)
+class TrabajoReporte(Base):
+    __tablename__ = "trabajos_reporte"
+
+    id = Column(String(32), primary_key=True)
+    usuario_id = Column(Integer, nullable=False)
+    tipo = Column(String(20), nullable=False)
+    formato = Column(String(10), nullable=False)
+    estado = Column(String(20), nullable=False)  # pendiente, procesando, listo, error
+    ruta = Column(String(500), nullable=False)
+    filas = Column(Integer)
+    error = Column(Text)
+    creado = Column(DateTime, nullable=False)
+    vence = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_trabajos_reporte_vence", "vence"),  # limpieza de vencidos
+    )
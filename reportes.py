@@ -0,0 +1,166 @@
+import csv
+import openpyxl
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet
+from database import ReplicaSessionLocal
+import models
+
+LOTE_FILAS = 1000
+
+
+# ✅ Consultas de exportación (solo columnas, sin hidratar objetos ORM)
+ENCABEZADOS_CLIENTES = ["ID", "Nombre", "Cédula", "Teléfono", "Correo", "Dirección", "Monto", "Fecha", "Estado"]
+ENCABEZADOS_PRESTAMOS = ["ID", "Cliente", "Monto Total", "Pagado", "Restante", "Fecha Inicio", "Fecha Límite", "Estado"]
+ENCABEZADOS_PAGOS = ["ID Pago", "ID Préstamo", "Monto", "Fecha", "Estado"]
+
+
+def consulta_clientes(db: Session):
+    c = models.Cliente
+    return db.query(
+        c.id, c.nombre, c.cedula, c.telefono, c.correo,
+        c.direccion, c.monto, c.fecha, c.estado
+    ).order_by(c.id)
+
+
+def consulta_prestamos(db: Session):
+    p = models.Prestamo
+    return db.query(
+        p.id,
+        func.coalesce(models.Cliente.nombre, "Sin cliente"),
+        p.monto_inicial + p.total_interes,
+        p.monto_pagado,
+        p.monto_restante,
+        p.fecha_inicio,
+        p.fecha_limite,
+        p.estado
+    ).outerjoin(models.Cliente, p.cliente_id == models.Cliente.id).order_by(p.id)
+
+
+def consulta_pagos(db: Session):
+    p = models.Pago
+    return db.query(
+        p.id, p.prestamo_id, p.monto_pagado, p.fecha_pago, p.estado
+    ).order_by(p.id)
+
+
+# ✅ Columnas de los PDF (más angostas que las de Excel/CSV)
+def consulta_clientes_pdf(db: Session):
+    c = models.Cliente
+    return db.query(
+        c.id, c.nombre, c.cedula, c.telefono, c.correo, c.monto, c.estado
+    ).order_by(c.id)
+
+
+def consulta_prestamos_pdf(db: Session):
+    p = models.Prestamo
+    return db.query(
+        p.id,
+        func.coalesce(models.Cliente.nombre, "Sin cliente"),
+        p.monto_inicial + p.total_interes,
+        p.monto_pagado,
+        p.monto_restante,
+        p.estado
+    ).outerjoin(models.Cliente, p.cliente_id == models.Cliente.id).order_by(p.id)
+
+
+REPORTES = {
+    "clientes": {
+        "modelos": [models.Cliente],
+        "titulo": "Clientes",
+        "encabezados": ENCABEZADOS_CLIENTES,
+        "consulta": consulta_clientes,
+        "titulo_pdf": "REPORTE DE CLIENTES",
+        "encabezados_pdf": ["ID", "Nombre", "Cédula", "Teléfono", "Correo", "Monto", "Estado"],
+        "consulta_pdf": consulta_clientes_pdf,
+    },
+    "prestamos": {
+        "modelos": [models.Prestamo, models.Cliente],
+        "titulo": "Prestamos",
+        "encabezados": ENCABEZADOS_PRESTAMOS,
+        "consulta": consulta_prestamos,
+        "titulo_pdf": "REPORTE DE PRÉSTAMOS",
+        "encabezados_pdf": ["ID", "Cliente", "Monto Total", "Pagado", "Restante", "Estado"],
+        "consulta_pdf": consulta_prestamos_pdf,
+    },
+    "pagos": {
+        "modelos": [models.Pago],
+        "titulo": "Pagos",
+        "encabezados": ENCABEZADOS_PAGOS,
+        "consulta": consulta_pagos,
+        "titulo_pdf": "REPORTE DE PAGOS",
+        "encabezados_pdf": ["ID Pago", "Préstamo", "Monto", "Fecha", "Estado"],
+        "consulta_pdf": consulta_pagos,
+    },
+}
+
+FORMATOS = {
+    "pdf": ("pdf", "application/pdf"),
+    "excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("csv", "text/csv"),
+}
+
+
+# ✅ Escritores (reciben un destino: ruta o archivo abierto)
+def escribir_excel(db: Session, titulo, encabezados, consulta, destino):
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=titulo)
+    ws.append(encabezados)
+
+    filas = 0
+    for fila in consulta(db).yield_per(LOTE_FILAS):
+        ws.append(list(fila))
+        filas += 1
+
+    wb.save(destino)
+    return filas
+
+
+def escribir_csv(db: Session, encabezados, consulta, destino):
+    filas = 0
+    with open(destino, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(encabezados)
+        for fila in consulta(db).yield_per(LOTE_FILAS):
+            writer.writerow(fila)
+            filas += 1
+    return filas
+
+
+def escribir_pdf(db: Session, titulo, encabezados, consulta, destino):
+    pdf = SimpleDocTemplate(destino, pagesize=letter)
+    estilos = getSampleStyleSheet()
+
+    tabla_data = [encabezados]
+    tabla_data.extend(list(fila) for fila in consulta(db).yield_per(LOTE_FILAS))
+
+    tabla = Table(tabla_data)
+    tabla.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold")
+    ]))
+
+    pdf.build([Paragraph(titulo, estilos["Title"]), tabla])
+    return len(tabla_data) - 1
+
+
+def escribir_reporte(db: Session, tipo, formato, destino):
+    reporte = REPORTES[tipo]
+    if formato == "pdf":
+        return escribir_pdf(db, reporte["titulo_pdf"], reporte["encabezados_pdf"], reporte["consulta_pdf"], destino)
+    if formato == "excel":
+        return escribir_excel(db, reporte["titulo"], reporte["encabezados"], reporte["consulta"], destino)
+    return escribir_csv(db, reporte["encabezados"], reporte["consulta"], destino)
+
+
+# ✅ Punto de entrada de los procesos de trabajo (abre su propia sesión, en la réplica)
+def generar_reporte(tipo, formato, destino):
+    db = ReplicaSessionLocal()
+    try:
+        return escribir_reporte(db, tipo, formato, destino)
+    finally:
+        db.close()
@@ -0,0 +1,254 @@
+from collections import defaultdict
+from datetime import date
+from sqlalchemy import event, func, case, extract, inspect, update, delete
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import Cliente, Prestamo, Pago, ResumenCartera, PagoMensual
+
+RESUMEN_ID = 1
+
+# Columna del resumen que cuenta cada estado de préstamo
+COLUMNAS_ESTADO = {
+    "Activo": "prestamos_activos",
+    "Pagado": "prestamos_pagados",
+    "Atrasado": "prestamos_atrasados",
+}
+
+
+def _sumar_prestamo(deltas, estado, interes, signo):
+    deltas["total_prestamos"] += signo
+    deltas["ganancias_interes"] += signo * (interes or 0)
+    if estado in COLUMNAS_ESTADO:
+        deltas[COLUMNAS_ESTADO[estado]] += signo
+
+
+def _sumar_pago(meses, fecha, monto, signo):
+    fecha = fecha or date.today()
+    acumulado = meses[(fecha.year, fecha.month)]
+    acumulado[0] += signo
+    acumulado[1] += signo * (monto or 0)
+
+
+def _valor_anterior(obj, atributo):
+    historia = inspect(obj).attrs[atributo].history
+    if not historia.has_changes():
+        return False, None, None
+    if not historia.deleted:
+        # El valor previo no estaba cargado: no se puede calcular el delta
+        return True, None, historia.added[0] if historia.added else None
+    return True, historia.deleted[0], historia.added[0] if historia.added else None
+
+
+# ✅ Calcula los cambios del resumen antes de cada flush (incluye borrados en cascada)
+@event.listens_for(Session, "before_flush")
+def _calcular_deltas(session, flush_context, instances):
+    deltas = defaultdict(float)
+    meses = defaultdict(lambda: [0, 0.0])
+    recalcular = False
+    recalcular_meses = False
+
+    for obj in session.new:
+        if isinstance(obj, Cliente):
+            deltas["total_clientes"] += 1
+        elif isinstance(obj, Prestamo):
+            _sumar_prestamo(deltas, obj.estado or "Activo", obj.total_interes, 1)
+        elif isinstance(obj, Pago):
+            _sumar_pago(meses, obj.fecha_pago, obj.monto_pagado, 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Cliente):
+            deltas["total_clientes"] -= 1
+        elif isinstance(obj, Prestamo):
+            _sumar_prestamo(deltas, obj.estado, obj.total_interes, -1)
+        elif isinstance(obj, Pago):
+            _sumar_pago(meses, obj.fecha_pago, obj.monto_pagado, -1)
+
+    for obj in session.dirty:
+        if obj in session.deleted:
+            continue
+
+        if isinstance(obj, Pago):
+            cambio_fecha, fecha_antes, _ = _valor_anterior(obj, "fecha_pago")
+            cambio_monto, monto_antes, _ = _valor_anterior(obj, "monto_pagado")
+            if cambio_fecha or cambio_monto:
+                if (cambio_fecha and fecha_antes is None) or (cambio_monto and monto_antes is None):
+                    recalcular_meses = True
+                else:
+                    _sumar_pago(meses, fecha_antes if cambio_fecha else obj.fecha_pago,
+                                monto_antes if cambio_monto else obj.monto_pagado, -1)
+                    _sumar_pago(meses, obj.fecha_pago, obj.monto_pagado, 1)
+            continue
+
+        if not isinstance(obj, Prestamo):
+            continue
+
+        cambio, antes, despues = _valor_anterior(obj, "estado")
+        if cambio:
+            if antes is None:
+                recalcular = True
+            elif antes != despues:
+                if antes in COLUMNAS_ESTADO:
+                    deltas[COLUMNAS_ESTADO[antes]] -= 1
+                if despues in COLUMNAS_ESTADO:
+                    deltas[COLUMNAS_ESTADO[despues]] += 1
+
+        cambio, antes, despues = _valor_anterior(obj, "total_interes")
+        if cambio:
+            if antes is None:
+                recalcular = True
+            else:
+                deltas["ganancias_interes"] += (despues or 0) - antes
+
+    # Pagos insertados fuera del ORM (lotes): se aplican en el mismo flush y en el mismo orden
+    for (anio, mes), (cantidad, monto) in session.info.pop("resumen_meses_externos", {}).items():
+        meses[(anio, mes)][0] += cantidad
+        meses[(anio, mes)][1] += monto
+
+    session.info["resumen_deltas"] = {k: v for k, v in deltas.items() if v}
+    session.info["resumen_recalcular"] = recalcular
+    session.info["resumen_meses"] = {k: v for k, v in meses.items() if v[0] or v[1]}
+    session.info["resumen_recalcular_meses"] = recalcular_meses
+
+
+# ✅ Aplica los cambios en la misma transacción del flush
+@event.listens_for(Session, "after_flush")
+def _aplicar_deltas(session, flush_context):
+    deltas = session.info.pop("resumen_deltas", None)
+    if session.info.pop("resumen_recalcular", False):
+        recalcular(session)
+    elif deltas:
+        ajustar(session, deltas)
+
+    meses = session.info.pop("resumen_meses", None)
+    if session.info.pop("resumen_recalcular_meses", False):
+        reconstruir_meses(session)
+    elif meses:
+        for (anio, mes), (cantidad, monto) in meses.items():
+            ajustar_mes(session, anio, mes, cantidad, monto)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_meses_externos(session):
+    session.info.pop("resumen_meses_externos", None)
+
+
+# Pagos por mes de un INSERT directo: se suman al acumulado en el próximo flush
+def registrar_meses(db: Session, meses):
+    externos = db.info.setdefault("resumen_meses_externos", {})
+    for clave, (cantidad, monto) in meses.items():
+        acumulado = externos.setdefault(clave, [0, 0.0])
+        acumulado[0] += cantidad
+        acumulado[1] += monto
+
+
+def ajustar(db: Session, deltas):
+    columnas = ResumenCartera.__table__.c
+    valores = {nombre: columnas[nombre] + delta for nombre, delta in deltas.items()}
+    db.execute(update(ResumenCartera.__table__).where(columnas.id == RESUMEN_ID).values(**valores))
+
+
+# ✅ Recalcula el resumen completo (una consulta agregada)
+def calcular(db: Session):
+    total_clientes = db.query(func.count(Cliente.id)).scalar_subquery()
+    fila = db.query(
+        total_clientes,
+        func.count(Prestamo.id),
+        *[func.coalesce(func.sum(case((Prestamo.estado == estado, 1), else_=0)), 0) for estado in COLUMNAS_ESTADO],
+        func.coalesce(func.sum(Prestamo.total_interes), 0)
+    ).select_from(Prestamo).one()
+
+    return {
+        "total_clientes": fila[0] or 0,
+        "total_prestamos": fila[1],
+        "prestamos_activos": int(fila[2]),
+        "prestamos_pagados": int(fila[3]),
+        "prestamos_atrasados": int(fila[4]),
+        "ganancias_interes": float(fila[5]),
+    }
+
+
+def recalcular(db: Session):
+    valores = calcular(db)
+    tabla = ResumenCartera.__table__
+    actualizado = db.execute(update(tabla).where(tabla.c.id == RESUMEN_ID).values(**valores))
+    if actualizado.rowcount == 0:
+        db.execute(tabla.insert().values(id=RESUMEN_ID, **valores))
+    return valores
+
+
+# ✅ Lee la fila precalculada (la crea la primera vez)
+def obtener(db: Session):
+    fila = db.query(ResumenCartera).filter(ResumenCartera.id == RESUMEN_ID).first()
+    if fila:
+        return fila
+
+    try:
+        recalcular(db)
+        db.commit()
+    except IntegrityError:
+        # Otro proceso la creó al mismo tiempo
+        db.rollback()
+    return db.query(ResumenCartera).filter(ResumenCartera.id == RESUMEN_ID).first()
+
+
+# -----------------------
+#   PAGOS POR MES
+# -----------------------
+def ajustar_mes(db: Session, anio, mes, cantidad, monto):
+    tabla = PagoMensual.__table__
+    dialecto = db.get_bind().dialect.name
+    valores = {"anio": anio, "mes": mes, "cantidad": cantidad, "monto": monto}
+
+    # Upsert atómico: la fila del mes puede no existir todavía
+    if dialecto == "mysql":
+        stmt = mysql.insert(tabla).values(**valores)
+        db.execute(stmt.on_duplicate_key_update(
+            cantidad=tabla.c.cantidad + stmt.inserted.cantidad,
+            monto=tabla.c.monto + stmt.inserted.monto
+        ))
+    elif dialecto == "sqlite":
+        stmt = sqlite.insert(tabla).values(**valores)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[tabla.c.anio, tabla.c.mes],
+            set_={"cantidad": tabla.c.cantidad + stmt.excluded.cantidad, "monto": tabla.c.monto + stmt.excluded.monto}
+        ))
+    else:
+        actualizado = db.execute(
+            update(tabla)
+            .where(tabla.c.anio == anio, tabla.c.mes == mes)
+            .values(cantidad=tabla.c.cantidad + cantidad, monto=tabla.c.monto + monto)
+        )
+        if actualizado.rowcount == 0:
+            db.execute(tabla.insert().values(**valores))
+
+
+# ✅ Reconstruye el acumulado completo (una sola pasada sobre pagos)
+def reconstruir_meses(db: Session):
+    anio = extract("year", Pago.fecha_pago)
+    mes = extract("month", Pago.fecha_pago)
+    filas = db.query(anio, mes, func.count(Pago.id), func.coalesce(func.sum(Pago.monto_pagado), 0)).group_by(anio, mes).all()
+
+    tabla = PagoMensual.__table__
+    db.execute(delete(tabla))
+    if filas:
+        db.execute(tabla.insert(), [
+            {"anio": int(a), "mes": int(m), "cantidad": c, "monto": float(t)} for a, m, c, t in filas
+        ])
+
+
+def pagos_por_mes(db: Session, anio=None, mes=None):
+    query = db.query(PagoMensual)
+    if anio:
+        query = query.filter(PagoMensual.anio == anio)
+    if mes:
+        query = query.filter(PagoMensual.mes == mes)
+    return query.all()
+
+
+# ✅ Al arrancar: crea el resumen y llena el acumulado si hay pagos previos
+def inicializar(db: Session):
+    obtener(db)
+    if db.query(PagoMensual.anio).first() is None and db.query(Pago.id).first() is not None:
+        reconstruir_meses(db)
+        db.commit()
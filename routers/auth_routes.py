@@ -1,6 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from auth import hash_password, verify_password, create_access_token, get_db, get_current_user
+from auth import (
+    hash_password_async, verify_password_async, metricas_hash,
+    create_access_token, get_db, get_current_user, invalidar_usuario
+)
 from models import Usuario
 from pydantic import BaseModel
 from typing import Optional
@@ -24,35 +28,49 @@ class UserUpdate(BaseModel):
     password: Optional[str] = None
 
 
-# ✅ Registro de usuarios
+def _buscar_por_email(db: Session, email: str):
+    return db.query(Usuario).filter(Usuario.email == email).first()
+
+
+def _guardar(db: Session, usuario: Usuario):
+    db.add(usuario)
+    db.commit()
+
+
+# ✅ Registro de usuarios (hash en el pool de procesos)
 @router.post("/register")
-def register(user: UserRegister, db: Session = Depends(get_db)):
-    user_db = db.query(Usuario).filter(Usuario.email == user.email).first()
+async def register(user: UserRegister, db: Session = Depends(get_db)):
+    user_db = await run_in_threadpool(_buscar_por_email, db, user.email)
     if user_db:
         raise HTTPException(status_code=400, detail="El correo ya está registrado")
 
     nuevo_usuario = Usuario(
         nombre=user.nombre,
         email=user.email,
-        password=hash_password(user.password)
+        password=await hash_password_async(user.password)
     )
 
-    db.add(nuevo_usuario)
-    db.commit()
+    await run_in_threadpool(_guardar, db, nuevo_usuario)
     return {"mensaje": "Usuario creado exitosamente"}
 
 
-# ✅ Login
+# ✅ Login (la verificación no ocupa hilos de la API)
 @router.post("/login")
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    user_db = db.query(Usuario).filter(Usuario.email == user.email).first()
-    if not user_db or not verify_password(user.password, user_db.password):
+async def login(user: UserLogin, db: Session = Depends(get_db)):
+    user_db = await run_in_threadpool(_buscar_por_email, db, user.email)
+    if not user_db or not await verify_password_async(user.password, user_db.password):
         raise HTTPException(status_code=400, detail="Credenciales inválidas")
 
     token = create_access_token({"sub": str(user_db.id)})
     return {"access_token": token, "token_type": "bearer"}
 
 
+# ✅ Métricas del pool de hashing
+@router.get("/metricas-hash")
+def metricas_pool_hash(usuario: Usuario = Depends(get_current_user)):
+    return metricas_hash()
+
+
 # ✅ Obtener usuario actual
 @router.get("/me")
 def leer_usuario_actual(usuario: Usuario = Depends(get_current_user)):
@@ -63,20 +81,28 @@ def leer_usuario_actual(usuario: Usuario = Depends(get_current_user)):
     }
 
 
-# ✅ Actualizar información del usuario
-@router.put("/update")
-def actualizar_usuario(data: UserUpdate, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    usuario = db.query(Usuario).filter(Usuario.id == user.id).first()
+def _actualizar(db: Session, user_id: int, data: UserUpdate, password: Optional[str]):
+    usuario = db.query(Usuario).filter(Usuario.id == user_id).first()
 
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
     usuario.nombre = data.nombre
     usuario.email = data.email
+    if password:
+        usuario.password = password
+
+    db.commit()
 
+
+# ✅ Actualizar información del usuario (hash en el pool de procesos)
+@router.put("/update")
+async def actualizar_usuario(data: UserUpdate, db: Session = Depends(get_db), user=Depends(get_current_user)):
     # ✅ Solo actualizar contraseña si se envía
+    password = None
     if data.password and data.password.strip() != "":
-        usuario.password = hash_password(data.password)
+        password = await hash_password_async(data.password)
 
-    db.commit()
+    await run_in_threadpool(_actualizar, db, user.id, data, password)
+    invalidar_usuario(user.id)
     return {"mensaje": "Usuario actualizado correctamente"}
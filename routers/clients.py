@@ -1,15 +1,22 @@
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from database import SessionLocal
+from database import SessionLocal, DB_ASYNC
 from models import Cliente
 from pydantic import BaseModel
 from datetime import date
-from typing import List, Optional, Dict, Any
-from auth import get_current_user
+from typing import List, Optional
+from auth import get_current_user, get_async_read_db, get_read_db
+from utils import paginar, seleccion_dispersa
+from serializacion import respuesta_json
+import busqueda
 
 router = APIRouter(prefix="/clientes", tags=["Clientes"])
 
+# Dependencias asíncronas solo si están habilitadas (requieren greenlet y el driver)
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import AsyncSession
+    import crud_async
+
 
 class ClienteBase(BaseModel):
     nombre: str
@@ -53,20 +60,72 @@ def crear_cliente(
     return nuevo_cliente
 
 
-# ✅ Listar clientes
-@router.get("/", response_model=List[ClienteOut])
-def listar_clientes(
-    db: Session = Depends(get_db),
+# ✅ Listar clientes (?fields=id,nombre devuelve solo esas columnas)
+if DB_ASYNC:
+    @router.get("/", response_model=List[ClienteOut])
+    async def listar_clientes(
+        fields: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_read_db),
+        usuario=Depends(get_current_user)
+    ):
+        if fields:
+            return respuesta_json(await crud_async.seleccion_dispersa(db, Cliente, (), fields))
+        return await crud_async.obtener_clientes(db)
+else:
+    @router.get("/", response_model=List[ClienteOut])
+    def listar_clientes(
+        fields: Optional[str] = None,
+        db: Session = Depends(get_read_db),
+        usuario=Depends(get_current_user)
+    ):
+        if fields:
+            return respuesta_json(seleccion_dispersa(db, Cliente, (), fields))
+        return db.query(Cliente).all()
+
+
+# ✅ Buscar cliente (índice invertido, sin tildes, ordenado por relevancia)
+@router.get("/buscar", response_model=List[ClienteOut])
+def buscar_clientes(
+    query: str,
+    limite: int = 20,
+    db: Session = Depends(get_read_db),
+    usuario = Depends(get_current_user)
+):
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Debe ingresar un texto de búsqueda")
+
+    if limite < 1 or limite > 100:
+        raise HTTPException(status_code=400, detail="limite debe estar entre 1 y 100")
+
+    ids = busqueda.buscar(db, query, limite)
+    if not ids:
+        return []
+
+    clientes = {c.id: c for c in db.query(Cliente).filter(Cliente.id.in_(ids)).all()}
+    return [clientes[i] for i in ids if i in clientes]
+
+
+# ✅ Paginación (offset o cursor keyset)
+@router.get("/paginar")
+def paginar_clientes(
+    page: int = 1,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    incluir_total: bool = True,
+    db: Session = Depends(get_read_db),
     usuario=Depends(get_current_user)
 ):
-    return db.query(Cliente).all()
+    return paginar(
+        db, db.query(Cliente), Cliente, [Cliente.id],
+        page, limit, cursor, incluir_total
+    )
 
 
 # ✅ Obtener cliente por ID
 @router.get("/{cliente_id}", response_model=ClienteOut)
 def obtener_cliente(
     cliente_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     usuario=Depends(get_current_user)
 ):
     cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
@@ -112,51 +171,3 @@ def eliminar_cliente(
     db.delete(cliente)
     db.commit()
     return {"mensaje": "Cliente eliminado correctamente ✅"}
-
-
-# ✅ Buscar cliente
-@router.get("/buscar", response_model=List[ClienteOut])
-def buscar_clientes(
-    query: str,
-    db: Session = Depends(get_db),
-    usuario = Depends(get_current_user)
-):
-    if not query.strip():
-        raise HTTPException(status_code=400, detail="Debe ingresar un texto de búsqueda")
-
-    resultados = db.query(Cliente).filter(
-        or_(
-            Cliente.nombre.like(f"%{query}%"),
-            Cliente.cedula.like(f"%{query}%"),
-            Cliente.telefono.like(f"%{query}%"),
-            Cliente.correo.like(f"%{query}%")
-        )
-    ).all()
-
-    return resultados
-
-
-# ✅ Paginación con respuesta tipada
-@router.get("/paginar")
-def paginar_clientes(
-    page: int = 1,
-    limit: int = 10,
-    db: Session = Depends(get_db),
-    usuario=Depends(get_current_user)
-) -> Dict[str, Any]:
-
-    if page < 1 or limit < 1:
-        raise HTTPException(status_code=400, detail="page y limit deben ser mayores a 0")
-
-    inicio = (page - 1) * limit
-
-    clientes = db.query(Cliente).offset(inicio).limit(limit).all()
-    total = db.query(Cliente).count()
-
-    return {
-        "pagina": page,
-        "por_pagina": limit,
-        "total_registros": total,
-        "total_paginas": (total + limit - 1) // limit,
-        "data": clientes
-    }
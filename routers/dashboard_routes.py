@@ -1,79 +1,102 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import extract, func
-from datetime import date
-from auth import get_db, get_current_user
+from datetime import date, timedelta
+from sqlalchemy import case, func
+from auth import get_read_db, get_async_read_db, get_current_user
+from database import DB_ASYNC
 import models
+import resumen
+import amortizacion
+from serializacion import respuesta_json
 
 router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
 
+# Dependencias asíncronas solo si están habilitadas (requieren greenlet y el driver)
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import AsyncSession
+    import crud_async
 
-# ✅ 1. Resumen General (Tarjetas superiores)
-@router.get("/resumen")
-def dashboard_resumen(
-    db: Session = Depends(get_db),
-    user=Depends(get_current_user)
-):
-
-    total_clientes = db.query(models.Cliente).count()
-    total_prestamos = db.query(models.Prestamo).count()
-
-    prestamos_activos = db.query(models.Prestamo).filter(models.Prestamo.estado == "Activo").count()
-    prestamos_pagados = db.query(models.Prestamo).filter(models.Prestamo.estado == "Pagado").count()
-    prestamos_atrasados = db.query(models.Prestamo).filter(models.Prestamo.estado == "Atrasado").count()
-
-    # ✅ SUMA REAL de los intereses pactados para la tarjeta de ganancias
-    ganancias_interes = db.query(func.sum(models.Prestamo.total_interes)).scalar()
-    if ganancias_interes is None:
-        ganancias_interes = 0
 
+# ✅ 1. Resumen General (Tarjetas superiores, desde la fila precalculada)
+def _resumen_respuesta(r):
     return {
-        "total_clientes": total_clientes,
-        "total_prestamos": total_prestamos,
-        "prestamos_activos": prestamos_activos,
-        "prestamos_pagados": prestamos_pagados,
-        "prestamos_atrasados": prestamos_atrasados,
-        "ganancias_interes": float(ganancias_interes),
+        "total_clientes": r.total_clientes,
+        "total_prestamos": r.total_prestamos,
+        "prestamos_activos": r.prestamos_activos,
+        "prestamos_pagados": r.prestamos_pagados,
+        "prestamos_atrasados": r.prestamos_atrasados,
+        "ganancias_interes": float(r.ganancias_interes),
 
         "por_estado": {
-            "Activo": prestamos_activos,
-            "Pagado": prestamos_pagados,
-            "Atrasado": prestamos_atrasados
+            "Activo": r.prestamos_activos,
+            "Pagado": r.prestamos_pagados,
+            "Atrasado": r.prestamos_atrasados
         }
     }
 
 
-# ✅ 2. Pagos por mes (para gráfica)
+if DB_ASYNC:
+    @router.get("/resumen")
+    async def dashboard_resumen(
+        db: AsyncSession = Depends(get_async_read_db),
+        user=Depends(get_current_user)
+    ):
+        return _resumen_respuesta(await crud_async.obtener_resumen(db))
+else:
+    @router.get("/resumen")
+    def dashboard_resumen(
+        db: Session = Depends(get_read_db),
+        user=Depends(get_current_user)
+    ):
+        return _resumen_respuesta(resumen.obtener(db))
+
+
+# ✅ 2. Pagos por mes (para gráfica, desde el acumulado por año y mes)
 @router.get("/pagos-mes")
 def pagos_por_mes(
-    db: Session = Depends(get_db),
+    anio: int | None = None,
+    db: Session = Depends(get_read_db),
     user=Depends(get_current_user)
 ):
-    pagos_mes = db.query(
-        extract('month', models.Pago.fecha_pago).label("mes"),
-        func.count(models.Pago.id)
-    ).group_by("mes").all()
+    anio = anio or date.today().year
 
-    resultado = {mes: 0 for mes in range(1, 13)}
-    for mes_db, cantidad in pagos_mes:
-        resultado[int(mes_db)] = cantidad
+    resultado = {mes: (0, 0.0) for mes in range(1, 13)}
+    for fila in resumen.pagos_por_mes(db, anio=anio):
+        resultado[fila.mes] = (fila.cantidad, fila.monto)
 
-    return [{"mes": m, "cantidad": resultado[m]} for m in range(1, 13)]
+    return [
+        {"mes": m, "cantidad": resultado[m][0], "monto": resultado[m][1]}
+        for m in range(1, 13)
+    ]
 
 
 # ✅ 3. Tabla de resumen de préstamos
 @router.get("/resumen-prestamos")
 def resumen_prestamos(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user=Depends(get_current_user)
 ):
-    prestamos = db.query(models.Prestamo).all()
+    # Proyección plana con el nombre del cliente: una sola consulta
+    prestamos = (
+        db.query(
+            models.Prestamo.id,
+            models.Cliente.nombre,
+            models.Prestamo.monto_inicial,
+            models.Prestamo.total_interes,
+            models.Prestamo.monto_pagado,
+            models.Prestamo.monto_restante,
+            models.Prestamo.estado,
+            models.Prestamo.fecha_limite,
+        )
+        .outerjoin(models.Cliente, models.Prestamo.cliente_id == models.Cliente.id)
+        .all()
+    )
 
     data = []
     for p in prestamos:
         data.append({
             "prestamo_id": p.id,
-            "cliente": p.cliente.nombre if p.cliente else "Sin cliente",
+            "cliente": p.nombre or "Sin cliente",
             "monto_total": p.monto_inicial + p.total_interes,
             "pagado": p.monto_pagado,
             "restante": p.monto_restante,
@@ -81,7 +104,7 @@ def resumen_prestamos(
             "fecha_limite": p.fecha_limite
         })
 
-    return {"data": data, "total": len(data)}
+    return respuesta_json({"data": data, "total": len(data)})
 
 
 # ✅ 4. Reporte general con filtros
@@ -89,41 +112,30 @@ def resumen_prestamos(
 def reporte_general(
     mes: int | None = None,
     anio: int | None = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user=Depends(get_current_user)
 ):
 
     if mes and (mes < 1 or mes > 12):
         raise HTTPException(status_code=400, detail="El mes debe estar entre 1 y 12")
 
-    pagos_query = db.query(models.Pago)
-
-    if mes:
-        pagos_query = pagos_query.filter(extract('month', models.Pago.fecha_pago) == mes)
+    # El acumulado responde cualquier combinación de año/mes sin recorrer pagos
+    acumulados = resumen.pagos_por_mes(db, anio=anio, mes=mes)
 
-    if anio:
-        pagos_query = pagos_query.filter(extract('year', models.Pago.fecha_pago) == anio)
-
-    pagos = pagos_query.all()
-
-    total_prestamos = db.query(models.Prestamo).count()
-    total_pagado = sum(p.monto_pagado for p in pagos)
-    clientes_activos = db.query(models.Prestamo).filter(models.Prestamo.estado == "Activo").count()
+    r = resumen.obtener(db)
+    total_prestamos = r.total_prestamos
+    total_pagado = sum(fila.monto for fila in acumulados)
+    clientes_activos = r.prestamos_activos
 
     resumen_estados = {
-        "Pagados": db.query(models.Prestamo).filter(models.Prestamo.estado == "Pagado").count(),
-        "Activos": db.query(models.Prestamo).filter(models.Prestamo.estado == "Activo").count(),
-        "Atrasados": db.query(models.Prestamo).filter(models.Prestamo.estado == "Atrasado").count()
+        "Pagados": r.prestamos_pagados,
+        "Activos": r.prestamos_activos,
+        "Atrasados": r.prestamos_atrasados
     }
 
-    pagos_mes = db.query(
-        extract('month', models.Pago.fecha_pago).label("mes"),
-        func.count(models.Pago.id)
-    ).group_by("mes").all()
-
     pagos_mensuales = {m: 0 for m in range(1, 13)}
-    for mes_db, cantidad in pagos_mes:
-        pagos_mensuales[int(mes_db)] = cantidad
+    for fila in resumen.pagos_por_mes(db, anio=anio or date.today().year):
+        pagos_mensuales[fila.mes] = fila.cantidad
 
     return {
         "total_prestamos": total_prestamos,
@@ -133,3 +145,77 @@ def reporte_general(
         "estado_prestamos": resumen_estados,
         "pagos_por_mes": pagos_mensuales
     }
+
+
+# ✅ 5. Cartera por antigüedad de mora (un solo GROUP BY sobre préstamos con saldo)
+TRAMOS_MORA = ("al_dia", "1-30", "31-60", "61-90", "90+")
+
+
+@router.get("/cartera")
+def cartera_vencida(
+    db: Session = Depends(get_read_db),
+    user=Depends(get_current_user)
+):
+    hoy = date.today()
+    limite = models.Prestamo.fecha_limite
+
+    # Fechas de corte calculadas aquí: el CASE es portable entre MySQL y SQLite
+    tramo = case(
+        (limite.is_(None), "al_dia"),
+        (limite >= hoy, "al_dia"),
+        (limite >= hoy - timedelta(days=30), "1-30"),
+        (limite >= hoy - timedelta(days=60), "31-60"),
+        (limite >= hoy - timedelta(days=90), "61-90"),
+        else_="90+",
+    ).label("tramo")
+
+    filas = (
+        db.query(
+            tramo,
+            models.Cliente.estado,
+            func.count(models.Prestamo.id),
+            func.coalesce(func.sum(models.Prestamo.monto_restante), 0),
+        )
+        .outerjoin(models.Cliente, models.Prestamo.cliente_id == models.Cliente.id)
+        .filter(models.Prestamo.monto_restante > 0)
+        .group_by(tramo, models.Cliente.estado)
+        .all()
+    )
+
+    def vacio():
+        return {t: {"prestamos": 0, "monto_restante": 0.0} for t in TRAMOS_MORA}
+
+    total = vacio()
+    por_estado_cliente = {}
+    for nombre_tramo, estado_cliente, cantidad, monto in filas:
+        estado_cliente = estado_cliente or "Sin estado"
+        for destino in (total, por_estado_cliente.setdefault(estado_cliente, vacio())):
+            destino[nombre_tramo]["prestamos"] += cantidad
+            destino[nombre_tramo]["monto_restante"] += float(monto)
+
+    vencido = [total[t] for t in TRAMOS_MORA[1:]]
+    saldo_total = sum(t["monto_restante"] for t in total.values())
+    saldo_vencido = sum(t["monto_restante"] for t in vencido)
+
+    return {
+        "fecha_corte": hoy,
+        "tramos": total,
+        "por_estado_cliente": por_estado_cliente,
+        "total_prestamos": sum(t["prestamos"] for t in total.values()),
+        "saldo_total": saldo_total,
+        "prestamos_vencidos": sum(t["prestamos"] for t in vencido),
+        "saldo_vencido": saldo_vencido,
+        "indice_mora": round(saldo_vencido / saldo_total, 4) if saldo_total else 0.0,
+    }
+
+
+# ✅ 6. Flujo de caja esperado (próximos días, por día o por semana)
+@router.get("/flujo-caja")
+def flujo_caja(
+    dias: int = 90,
+    agrupacion: str = "dia",
+    cuotas: int = 1,
+    db: Session = Depends(get_read_db),
+    user=Depends(get_current_user)
+):
+    return respuesta_json(amortizacion.proyectar_flujo(db, dias, agrupacion, cuotas))
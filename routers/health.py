@@ -0,0 +1,36 @@
+import time
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from auth import get_db
+import database
+from database import estadisticas_pool
+import tareas
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+
+# ✅ Estado de la base de datos y del pool de conexiones
+@router.get("/db")
+def health_db(db: Session = Depends(get_db)):
+    inicio = time.perf_counter()
+    try:
+        db.execute(text("SELECT 1"))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Base de datos no disponible: {e.__class__.__name__}")
+    latencia = (time.perf_counter() - inicio) * 1000
+
+    datos = {
+        "estado": "ok",
+        "latencia_ms": round(latencia, 3),
+        "pool": estadisticas_pool()
+    }
+    if database.replica_engine is not None:
+        datos["pool_replica"] = estadisticas_pool(database.replica_engine)
+    return datos
+
+
+# ✅ Estado del programador de tareas de mantenimiento
+@router.get("/tareas")
+def health_tareas():
+    return {"habilitadas": tareas.TAREAS_HABILITADAS, "tareas": tareas.estado()}
@@ -1,42 +1,153 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
-from datetime import date
-from auth import get_db, get_current_user
+from typing import Optional
+from auth import get_db, get_read_db, get_async_read_db, get_current_user
+from database import DB_ASYNC
 import models, schemas, crud
+import amortizacion
+import idempotencia
+from utils import paginar, seleccion_dispersa
+from serializacion import RESPUESTAS_RAPIDAS, respuesta_json, respuesta_lista, serializar_prestamo
 
 router = APIRouter(prefix="/prestamos", tags=["Prestamos"])
 
+# Dependencias asíncronas solo si están habilitadas (requieren greenlet y el driver)
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import AsyncSession
+    import crud_async
+
 
 # ✅ Crear préstamo
 @router.post("/", response_model=schemas.Prestamo)
 def crear_prestamo(
     prestamo: schemas.PrestamoCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     user = Depends(get_current_user)
 ):
-    return crud.crear_prestamo(db, prestamo)
+    return idempotencia.ejecutar(
+        db, idempotency_key, "prestamos", user.id, prestamo,
+        lambda: schemas.Prestamo.model_validate(crud.crear_prestamo(db, prestamo)),
+        models.Prestamo, schemas.Prestamo
+    )
 
 
 # ✅ Listar todos los préstamos
-@router.get("/", response_model=list[schemas.Prestamo])
-def listar_prestamos(
+# ?fields=id,monto_restante,cliente.nombre y ?expand=cliente devuelven solo esas columnas
+RELACIONES = ("cliente",)
+
+if DB_ASYNC:
+    @router.get("/", response_model=list[schemas.Prestamo])
+    async def listar_prestamos(
+        fields: Optional[str] = None,
+        expand: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_read_db),
+        user = Depends(get_current_user)
+    ):
+        if fields or expand:
+            data = await crud_async.seleccion_dispersa(db, models.Prestamo, RELACIONES, fields, expand)
+            return respuesta_json(data)
+        if RESPUESTAS_RAPIDAS:
+            return respuesta_lista(await crud_async.listar_prestamos(db), serializar_prestamo)
+        return await crud_async.listar_prestamos(db)
+else:
+    @router.get("/", response_model=list[schemas.Prestamo])
+    def listar_prestamos(
+        fields: Optional[str] = None,
+        expand: Optional[str] = None,
+        db: Session = Depends(get_read_db),
+        user = Depends(get_current_user)
+    ):
+        if fields or expand:
+            data = seleccion_dispersa(db, models.Prestamo, RELACIONES, fields, expand)
+            return respuesta_json(data)
+        if RESPUESTAS_RAPIDAS:
+            return respuesta_lista(crud.listar_prestamos(db), serializar_prestamo)
+        return crud.listar_prestamos(db)
+
+
+# ✅ Paginación (offset o cursor keyset)
+@router.get("/paginar")
+def paginar_prestamos(
+    page: int = 1,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    incluir_total: bool = True,
+    db: Session = Depends(get_read_db),
+    user = Depends(get_current_user)
+):
+    return paginar(
+        db, db.query(models.Prestamo), models.Prestamo, [models.Prestamo.id],
+        page, limit, cursor, incluir_total
+    )
+
+
+# ✅ Verificar préstamos atrasados (también corre a diario en el programador de tareas)
+@router.put("/verificar-atrasados")
+def verificar_atrasados(
     db: Session = Depends(get_db),
     user = Depends(get_current_user)
 ):
-    return crud.listar_prestamos(db)
+    actualizados = crud.marcar_atrasados(db)
+    return {"mensaje": "Estados actualizados ✅", "actualizados": actualizados}
+
+
+# ✅ Cronogramas de la cartera por páginas (cuota fija, interés plano; cálculo vectorizado)
+@router.get("/cronogramas")
+def cronogramas_cartera(
+    cuotas: int = 1,
+    estado: Optional[str] = None,
+    cliente_id: Optional[int] = None,
+    page: int = 1,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    incluir_total: bool = True,
+    db: Session = Depends(get_read_db),
+    user = Depends(get_current_user)
+):
+    pagina = amortizacion.cronogramas_paginados(
+        db, cuotas, page, limit, cursor, incluir_total, cliente_id=cliente_id, estado=estado
+    )
+    return respuesta_json({"cuotas": cuotas, **pagina})
 
 
 # ✅ Obtener préstamo por ID
-@router.get("/{prestamo_id}", response_model=schemas.Prestamo)
-def obtener_prestamo(
+if DB_ASYNC:
+    @router.get("/{prestamo_id}", response_model=schemas.Prestamo)
+    async def obtener_prestamo(
+        prestamo_id: int,
+        db: AsyncSession = Depends(get_async_read_db),
+        user = Depends(get_current_user)
+    ):
+        prestamo = await crud_async.obtener_prestamo(db, prestamo_id)
+        if not prestamo:
+            raise HTTPException(status_code=404, detail="Préstamo no encontrado")
+        return prestamo
+else:
+    @router.get("/{prestamo_id}", response_model=schemas.Prestamo)
+    def obtener_prestamo(
+        prestamo_id: int,
+        db: Session = Depends(get_read_db),
+        user = Depends(get_current_user)
+    ):
+        prestamo = crud.obtener_prestamo(db, prestamo_id)
+        if not prestamo:
+            raise HTTPException(status_code=404, detail="Préstamo no encontrado")
+        return prestamo
+
+
+# ✅ Cronograma de pagos de un préstamo
+@router.get("/{prestamo_id}/cronograma")
+def cronograma_prestamo(
     prestamo_id: int,
-    db: Session = Depends(get_db),
+    cuotas: int = 1,
+    db: Session = Depends(get_read_db),
     user = Depends(get_current_user)
 ):
-    prestamo = crud.obtener_prestamo(db, prestamo_id)
-    if not prestamo:
+    data = amortizacion.cronogramas(db, cuotas, prestamo_id=prestamo_id)
+    if not data:
         raise HTTPException(status_code=404, detail="Préstamo no encontrado")
-    return prestamo
+    return data[0]
 
 
 # ✅ Actualizar préstamo
@@ -70,54 +181,12 @@ def eliminar_prestamo(
 @router.get("/cliente/{cliente_id}", response_model=list[schemas.Prestamo])
 def prestamos_por_cliente(
     cliente_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user = Depends(get_current_user)
 ):
-    prestamos = db.query(models.Prestamo).filter(models.Prestamo.cliente_id == cliente_id).all()
+    prestamos = crud.prestamos_por_cliente(db, cliente_id)
 
     if not prestamos:
         raise HTTPException(status_code=404, detail="El cliente no tiene préstamos registrados")
 
     return prestamos
-
-
-# ✅ Verificar préstamos atrasados
-@router.put("/verificar-atrasados")
-def verificar_atrasados(
-    db: Session = Depends(get_db),
-    user = Depends(get_current_user)
-):
-    hoy = date.today()
-    prestamos = db.query(models.Prestamo).all()
-
-    for prestamo in prestamos:
-        if prestamo.monto_restante > 0 and prestamo.fecha_limite < hoy:
-            prestamo.estado = "Atrasado"
-
-    db.commit()
-    return {"mensaje": "Estados actualizados ✅"}
-
-
-# ✅ Paginación con esquema de respuesta
-@router.get("/paginar")
-def paginar_prestamos(
-    page: int = 1,
-    limit: int = 10,
-    db: Session = Depends(get_db),
-    user = Depends(get_current_user)
-):
-    if page < 1 or limit < 1:
-        raise HTTPException(status_code=400, detail="page y limit deben ser mayores a 0")
-
-    inicio = (page - 1) * limit
-
-    prestamos = db.query(models.Prestamo).offset(inicio).limit(limit).all()
-    total = db.query(models.Prestamo).count()
-
-    return {
-        "pagina": page,
-        "por_pagina": limit,
-        "total_registros": total,
-        "total_paginas": (total + limit - 1) // limit,
-        "data": prestamos
-    }
@@ -0,0 +1,24 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from database import estadisticas_pool
+import auth
+import cache
+import metricas
+
+router = APIRouter(tags=["Metricas"])
+
+
+# ✅ Métricas en formato Prometheus (sin autenticación, como /health)
+@router.get("/metrics", response_class=PlainTextResponse)
+def exportar_metricas():
+    extras = []
+    pool = estadisticas_pool()
+    for clave in ("en_uso", "libres", "overflow", "esperas", "timeouts"):
+        if clave in pool:
+            extras += metricas.gauge(f"db_pool_{clave}", f"Pool de conexiones: {clave}", pool[clave])
+    for clave, valor in auth.metricas_hash().items():
+        extras += metricas.gauge(f"auth_hash_{clave}", f"Pool de hashing: {clave}", valor)
+    for clave, valor in cache.estadisticas().items():
+        extras += metricas.gauge(f"reportes_cache_{clave}", f"Caché de reportes: {clave}", valor)
+
+    return PlainTextResponse(metricas.exportar(extras), media_type="text/plain; version=0.0.4")
@@ -1,52 +1,90 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
-from auth import get_db, get_current_user
+from typing import Optional
+from auth import get_db, get_read_db, get_async_read_db, get_current_user
+from database import DB_ASYNC
 import models, schemas, crud
+import idempotencia
+from utils import paginar, seleccion_dispersa
+from serializacion import RESPUESTAS_RAPIDAS, respuesta_json, respuesta_lista, serializar_pago
 
 router = APIRouter(prefix="/pagos", tags=["Pagos"])
 
+# Dependencias asíncronas solo si están habilitadas (requieren greenlet y el driver)
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import AsyncSession
+    import crud_async
+
 
 # ✅ Registrar pago
 @router.post("/", response_model=schemas.PagoResponse)
 def registrar_pago(
     pago: schemas.PagoCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     user = Depends(get_current_user)
 ):
-
-    # ✅ Validar Cliente
-    cliente = db.query(models.Cliente).filter(models.Cliente.id == pago.cliente_id).first()
-    if not cliente:
-        raise HTTPException(status_code=404, detail="Cliente no encontrado")
-
-    # ✅ Validar Préstamo
-    prestamo = db.query(models.Prestamo).filter(models.Prestamo.id == pago.prestamo_id).first()
-    if not prestamo:
-        raise HTTPException(status_code=404, detail="Préstamo no encontrado")
-
-    # ✅ Validaciones integradas en el crud
-    nuevo_pago = crud.crear_pago(db, pago)
-
-    return nuevo_pago
-
-
-# ✅ Listar todos los pagos
-@router.get("/", response_model=list[schemas.PagoResponse])
-def listar_pagos(
+    # ✅ Validaciones, bloqueo del saldo y reintentos integrados en el crud;
+    # con Idempotency-Key un reintento recibe la respuesta guardada sin volver a pagar
+    return idempotencia.ejecutar(
+        db, idempotency_key, "pagos", user.id, pago,
+        lambda: schemas.PagoResponse.model_validate(crud.crear_pago(db, pago)),
+        models.Pago, schemas.PagoResponse
+    )
+
+
+# ✅ Registrar pagos en lote (cierre del día de los cobradores)
+@router.post("/bulk")
+def registrar_pagos_bulk(
+    data: schemas.PagoBulkCreate,
     db: Session = Depends(get_db),
     user = Depends(get_current_user)
 ):
-    return db.query(models.Pago).all()
+    return crud.crear_pagos_bulk(db, data.pagos)
+
+
+# ✅ Listar todos los pagos
+# ?fields=id,monto_pagado,prestamo.monto_restante y ?expand=cliente,prestamo devuelven solo esas columnas
+RELACIONES = ("cliente", "prestamo")
+
+if DB_ASYNC:
+    @router.get("/", response_model=list[schemas.PagoResponse])
+    async def listar_pagos(
+        fields: Optional[str] = None,
+        expand: Optional[str] = None,
+        db: AsyncSession = Depends(get_async_read_db),
+        user = Depends(get_current_user)
+    ):
+        if fields or expand:
+            data = await crud_async.seleccion_dispersa(db, models.Pago, RELACIONES, fields, expand)
+            return respuesta_json(data)
+        if RESPUESTAS_RAPIDAS:
+            return respuesta_lista(await crud_async.listar_pagos(db), serializar_pago)
+        return await crud_async.listar_pagos(db)
+else:
+    @router.get("/", response_model=list[schemas.PagoResponse])
+    def listar_pagos(
+        fields: Optional[str] = None,
+        expand: Optional[str] = None,
+        db: Session = Depends(get_read_db),
+        user = Depends(get_current_user)
+    ):
+        if fields or expand:
+            data = seleccion_dispersa(db, models.Pago, RELACIONES, fields, expand)
+            return respuesta_json(data)
+        if RESPUESTAS_RAPIDAS:
+            return respuesta_lista(crud.consulta_pagos(db).all(), serializar_pago)
+        return crud.consulta_pagos(db).all()
 
 
 # ✅ Pagos por Cliente
 @router.get("/cliente/{cliente_id}", response_model=list[schemas.PagoResponse])
 def pagos_por_cliente(
     cliente_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user = Depends(get_current_user)
 ):
-    pagos = db.query(models.Pago).filter(models.Pago.cliente_id == cliente_id).all()
+    pagos = crud.consulta_pagos(db).filter(models.Pago.cliente_id == cliente_id).all()
     if not pagos:
         raise HTTPException(status_code=404, detail="No hay pagos para este cliente")
     return pagos
@@ -56,35 +94,26 @@ def pagos_por_cliente(
 @router.get("/prestamo/{prestamo_id}", response_model=list[schemas.PagoResponse])
 def pagos_por_prestamo(
     prestamo_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user = Depends(get_current_user)
 ):
-    pagos = db.query(models.Pago).filter(models.Pago.prestamo_id == prestamo_id).all()
+    pagos = crud.consulta_pagos(db).filter(models.Pago.prestamo_id == prestamo_id).all()
     if not pagos:
         raise HTTPException(status_code=404, detail="No hay pagos para este préstamo")
     return pagos
 
 
-# ✅ PAGINAR pagos
+# ✅ PAGINAR pagos (offset o cursor keyset por fecha_pago, id)
 @router.get("/paginar")
 def paginar_pagos(
     page: int = 1,
     limit: int = 10,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    incluir_total: bool = True,
+    db: Session = Depends(get_read_db),
     user = Depends(get_current_user)
 ):
-    if page < 1 or limit < 1:
-        raise HTTPException(status_code=400, detail="page y limit deben ser mayores a 0")
-
-    inicio = (page - 1) * limit
-
-    pagos = db.query(models.Pago).offset(inicio).limit(limit).all()
-    total = db.query(models.Pago).count()
-
-    return {
-        "pagina": page,
-        "por_pagina": limit,
-        "total_registros": total,
-        "total_paginas": (total + limit - 1) // limit,
-        "data": pagos
-    }
+    return paginar(
+        db, db.query(models.Pago), models.Pago, [models.Pago.fecha_pago, models.Pago.id],
+        page, limit, cursor, incluir_total
+    )
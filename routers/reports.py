@@ -1,307 +1,227 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from fastapi.responses import FileResponse
-from auth import get_db, get_current_user
-import models
-import openpyxl
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel
+from auth import get_read_db, get_current_user
+from database import SessionLocal, ReplicaSessionLocal
+from reportes import REPORTES, FORMATOS, LOTE_FILAS, escribir_reporte
+import cache
+import jobs
 import os
 import csv
+import io
+import time
 
 router = APIRouter(prefix="/reportes", tags=["Reportes"])
 
+CSV_BUFFER_BYTES = 64 * 1024
+
+
+# ✅ Caché por versión de datos: si nada cambió se envía el archivo ya generado.
+# La versión sale siempre de la primaria; lo generado en la réplica solo se guarda
+# si la réplica ya alcanzó esa versión (si no, clave es None y no se cachea).
+# En ambos lados solo se leen las filas de versiones_tablas (por clave primaria),
+# nunca agregados sobre las tablas de datos
+def _buscar_en_cache(db: Session, tipo, formato):
+    modelos = REPORTES[tipo]["modelos"]
+    if db.info.get("replica"):
+        with SessionLocal() as primaria:
+            version = cache.version_datos(primaria, modelos)
+        guardable = cache.version_datos(db, modelos) == version
+    else:
+        version = cache.version_datos(db, modelos)
+        guardable = True
+
+    clave = cache.clave_reporte(tipo, formato, version)
+    return (clave if guardable else None), cache.obtener(clave)
+
+
+def _respuesta_archivo(ruta, formato, nombre, headers):
+    return FileResponse(ruta, media_type=FORMATOS[formato][1], filename=nombre, headers=headers)
+
+
+# ✅ Generar (o reutilizar) un archivo: Excel en modo write-only, PDF con reportlab
+def _respuesta_generada(db: Session, tipo, formato, nombre):
+    clave, ruta = _buscar_en_cache(db, tipo, formato)
+    if ruta:
+        return _respuesta_archivo(ruta, formato, nombre, {"X-Reporte-Cache": "HIT"})
+
+    extension = FORMATOS[formato][0]
+    inicio = time.perf_counter()
+    temporal = cache.ruta_temporal(extension)
+    try:
+        filas = escribir_reporte(db, tipo, formato, temporal)
+    except Exception:
+        os.remove(temporal)
+        raise
+    segundos = time.perf_counter() - inicio
+    filas_por_segundo = filas / segundos if segundos > 0 else filas
+
+    headers = {
+        "X-Reporte-Cache": "MISS" if clave else "BYPASS",
+        "X-Reporte-Filas": str(filas),
+        "X-Reporte-Filas-Por-Segundo": f"{filas_por_segundo:.0f}"
+    }
+    if not clave:
+        # Réplica atrasada: se envía y se borra, sin guardarlo en la caché
+        return FileResponse(
+            temporal, media_type=FORMATOS[formato][1], filename=nombre, headers=headers,
+            background=BackgroundTask(os.remove, temporal)
+        )
+
+    ruta = cache.guardar(clave, temporal, extension)
+    return _respuesta_archivo(ruta, formato, nombre, headers)
+
 
 # ✅ Exportar reporte de clientes a Excel
 @router.get("/clientes/excel")
-def exportar_clientes_excel(db: Session = Depends(get_db), user=Depends(get_current_user)):
-
-    clientes = db.query(models.Cliente).all()
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Clientes"
-
-    # Encabezados
-    ws.append([
-        "ID", "Nombre", "Cédula", "Teléfono", "Correo", "Dirección",
-        "Monto", "Fecha", "Estado"
-    ])
-
-    # Registros
-    for c in clientes:
-        ws.append([
-            c.id, c.nombre, c.cedula, c.telefono, c.correo,
-            c.direccion, c.monto, str(c.fecha), c.estado
-        ])
-
-    # Guardar archivo temporal
-    archivo = "clientes_reporte.xlsx"
-    wb.save(archivo)
-
-    return FileResponse(
-        path=archivo,
-        filename=archivo,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+def exportar_clientes_excel(db: Session = Depends(get_read_db), user=Depends(get_current_user)):
+    return _respuesta_generada(db, "clientes", "excel", "clientes_reporte.xlsx")
 
 
 # ✅ Exportar reporte de préstamos a Excel
 @router.get("/prestamos/excel")
-def exportar_prestamos_excel(db: Session = Depends(get_db), user=Depends(get_current_user)):
-
-    prestamos = db.query(models.Prestamo).all()
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Prestamos"
-
-    ws.append([
-        "ID", "Cliente", "Monto Total", "Pagado", "Restante",
-        "Fecha Inicio", "Fecha Límite", "Estado"
-    ])
-
-    for p in prestamos:
-        ws.append([
-            p.id,
-            p.cliente.nombre if p.cliente else "Sin cliente",
-            p.monto_inicial + p.total_interes,
-            p.monto_pagado,
-            p.monto_restante,
-            str(p.fecha_inicio),
-            str(p.fecha_limite),
-            p.estado
-        ])
-
-    archivo = "prestamos_reporte.xlsx"
-    wb.save(archivo)
-
-    return FileResponse(
-        path=archivo,
-        filename=archivo,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+def exportar_prestamos_excel(db: Session = Depends(get_read_db), user=Depends(get_current_user)):
+    return _respuesta_generada(db, "prestamos", "excel", "prestamos_reporte.xlsx")
 
 
 # ✅ Exportar reporte de pagos a Excel
 @router.get("/pagos/excel")
-def exportar_pagos_excel(db: Session = Depends(get_db), user=Depends(get_current_user)):
-
-    pagos = db.query(models.Pago).all()
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Pagos"
-
-    ws.append(["ID Pago", "ID Préstamo", "Monto", "Fecha", "Estado"])
-
-    for p in pagos:
-        ws.append([
-            p.id, p.prestamo_id, p.monto_pagado,
-            str(p.fecha_pago), p.estado
-        ])
-
-    archivo = "pagos_reporte.xlsx"
-    wb.save(archivo)
-
-    return FileResponse(
-        path=archivo,
-        filename=archivo,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+def exportar_pagos_excel(db: Session = Depends(get_read_db), user=Depends(get_current_user)):
+    return _respuesta_generada(db, "pagos", "excel", "pagos_reporte.xlsx")
+
+
+# ✅ CSV en streaming: filas por lotes desde un cursor del servidor, sin archivos compartidos
+def _stream_csv(tipo, clave, replica=False):
+    encabezados = REPORTES[tipo]["encabezados"]
+    consulta = REPORTES[tipo]["consulta"]
+
+    # Sesión propia: el generador sigue leyendo después de que el handler retorna
+    db = ReplicaSessionLocal() if replica else SessionLocal()
+    temporal = cache.ruta_temporal("csv")
+    completo = False
+    try:
+        with open(temporal, "w", newline="", encoding="utf-8") as copia:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(encabezados)
+
+            for fila in consulta(db).yield_per(LOTE_FILAS):
+                writer.writerow(fila)
+                if buffer.tell() >= CSV_BUFFER_BYTES:
+                    bloque = buffer.getvalue()
+                    copia.write(bloque)
+                    yield bloque
+                    buffer.seek(0)
+                    buffer.truncate()
+
+            bloque = buffer.getvalue()
+            copia.write(bloque)
+            yield bloque
+        completo = True
+    finally:
+        db.close()
+        # Solo se cachea si el cliente recibió el archivo completo (y la versión es confiable)
+        if completo and clave:
+            cache.guardar(clave, temporal, "csv")
+        elif os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def _respuesta_csv(db: Session, tipo, archivo):
+    clave, ruta = _buscar_en_cache(db, tipo, "csv")
+    if ruta:
+        return _respuesta_archivo(ruta, "csv", archivo, {"X-Reporte-Cache": "HIT"})
+
+    return StreamingResponse(
+        _stream_csv(tipo, clave, replica=db.info.get("replica", False)),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f'attachment; filename="{archivo}"',
+            "X-Reporte-Cache": "MISS" if clave else "BYPASS"
+        }
     )
 
 
-
 # ✅ Exportar clientes CSV
 @router.get("/clientes/csv")
-def exportar_clientes_csv(db: Session = Depends(get_db), user=Depends(get_current_user)):
-
-    clientes = db.query(models.Cliente).all()
-    archivo = "clientes_reporte.csv"
-
-    with open(archivo, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["ID", "Nombre", "Cédula", "Teléfono", "Correo", "Dirección", "Monto", "Fecha", "Estado"])
-
-        for c in clientes:
-            writer.writerow([
-                c.id, c.nombre, c.cedula, c.telefono, c.correo,
-                c.direccion, c.monto, str(c.fecha), c.estado
-            ])
-
-    return FileResponse(
-        archivo,
-        media_type="text/csv",
-        filename=archivo
-    )
+def exportar_clientes_csv(db: Session = Depends(get_read_db), user=Depends(get_current_user)):
+    return _respuesta_csv(db, "clientes", "clientes_reporte.csv")
 
 
 # ✅ Exportar préstamos CSV
 @router.get("/prestamos/csv")
-def exportar_prestamos_csv(db: Session = Depends(get_db), user=Depends(get_current_user)):
-
-    prestamos = db.query(models.Prestamo).all()
-    archivo = "prestamos_reporte.csv"
-
-    with open(archivo, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["ID", "Cliente", "Monto Total", "Pagado", "Restante", "Fecha Inicio", "Fecha Límite", "Estado"])
-
-        for p in prestamos:
-            writer.writerow([
-                p.id,
-                p.cliente.nombre if p.cliente else "Sin cliente",
-                p.monto_inicial + p.total_interes,
-                p.monto_pagado,
-                p.monto_restante,
-                str(p.fecha_inicio),
-                str(p.fecha_limite),
-                p.estado
-            ])
-
-    return FileResponse(
-        archivo,
-        media_type="text/csv",
-        filename=archivo
-    )
+def exportar_prestamos_csv(db: Session = Depends(get_read_db), user=Depends(get_current_user)):
+    return _respuesta_csv(db, "prestamos", "prestamos_reporte.csv")
 
 
 # ✅ Exportar pagos CSV
 @router.get("/pagos/csv")
-def exportar_pagos_csv(db: Session = Depends(get_db), user=Depends(get_current_user)):
-
-    pagos = db.query(models.Pago).all()
-    archivo = "pagos_reporte.csv"
-
-    with open(archivo, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["ID Pago", "ID Préstamo", "Monto", "Fecha", "Estado"])
+def exportar_pagos_csv(db: Session = Depends(get_read_db), user=Depends(get_current_user)):
+    return _respuesta_csv(db, "pagos", "pagos_reporte.csv")
 
-        for p in pagos:
-            writer.writerow([
-                p.id,
-                p.prestamo_id,
-                p.monto_pagado,
-                str(p.fecha_pago),
-                p.estado
-            ])
-
-    return FileResponse(
-        archivo,
-        media_type="text/csv",
-        filename=archivo
-    )
 
-
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from fastapi.responses import FileResponse
-
-
-# ✅ Exportar clientes a PDF
+# ✅ Exportar clientes a PDF (para tablas grandes usar /reportes/jobs)
 @router.get("/clientes/pdf")
-def clientes_pdf(db: Session = Depends(get_db), user=Depends(get_current_user)):
-
-    archivo = "clientes_reporte.pdf"
-    clientes = db.query(models.Cliente).all()
-
-    # PDF
-    pdf = SimpleDocTemplate(archivo, pagesize=letter)
-    elementos = []
-    estilos = getSampleStyleSheet()
-
-    elementos.append(Paragraph("REPORTE DE CLIENTES", estilos["Title"]))
-
-    tabla_data = [["ID", "Nombre", "Cédula", "Teléfono", "Correo", "Monto", "Estado"]]
-
-    for c in clientes:
-        tabla_data.append([
-            c.id, c.nombre, c.cedula, c.telefono, c.correo, c.monto, c.estado
-        ])
-
-    tabla = Table(tabla_data)
-    tabla.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold")
-    ]))
-
-    elementos.append(tabla)
-    pdf.build(elementos)
-
-    return FileResponse(archivo, media_type="application/pdf", filename=archivo)
+def clientes_pdf(db: Session = Depends(get_read_db), user=Depends(get_current_user)):
+    return _respuesta_generada(db, "clientes", "pdf", "clientes_reporte.pdf")
 
 
 # ✅ Exportar préstamos a PDF
 @router.get("/prestamos/pdf")
-def prestamos_pdf(db: Session = Depends(get_db), user=Depends(get_current_user)):
-
-    archivo = "prestamos_reporte.pdf"
-    prestamos = db.query(models.Prestamo).all()
-
-    pdf = SimpleDocTemplate(archivo, pagesize=letter)
-    elementos = []
-    estilos = getSampleStyleSheet()
-
-    elementos.append(Paragraph("REPORTE DE PRÉSTAMOS", estilos["Title"]))
-
-    tabla_data = [["ID", "Cliente", "Monto Total", "Pagado", "Restante", "Estado"]]
+def prestamos_pdf(db: Session = Depends(get_read_db), user=Depends(get_current_user)):
+    return _respuesta_generada(db, "prestamos", "pdf", "prestamos_reporte.pdf")
 
-    for p in prestamos:
-        tabla_data.append([
-            p.id,
-            p.cliente.nombre if p.cliente else "Sin cliente",
-            p.monto_inicial + p.total_interes,
-            p.monto_pagado,
-            p.monto_restante,
-            p.estado
-        ])
 
-    tabla = Table(tabla_data)
-    tabla.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold")
-    ]))
+# ✅ Exportar pagos a PDF
+@router.get("/pagos/pdf")
+def pagos_pdf(db: Session = Depends(get_read_db), user=Depends(get_current_user)):
+    return _respuesta_generada(db, "pagos", "pdf", "pagos_reporte.pdf")
 
-    elementos.append(tabla)
-    pdf.build(elementos)
 
-    return FileResponse(archivo, media_type="application/pdf", filename=archivo)
+# -----------------------
+#   TRABAJOS ASÍNCRONOS
+# -----------------------
+class ReporteJobCreate(BaseModel):
+    tipo: str
+    formato: str = "pdf"
 
 
-# ✅ Exportar pagos a PDF
-@router.get("/pagos/pdf")
-def pagos_pdf(db: Session = Depends(get_db), user=Depends(get_current_user)):
+# ✅ Encolar reporte (se genera en el pool de procesos)
+@router.post("/jobs", status_code=202)
+def crear_job(data: ReporteJobCreate, db: Session = Depends(get_read_db), user=Depends(get_current_user)):
+    if data.tipo not in REPORTES:
+        raise HTTPException(status_code=400, detail="Tipo de reporte no válido")
+    if data.formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail="Formato de reporte no válido")
 
-    archivo = "pagos_reporte.pdf"
-    pagos = db.query(models.Pago).all()
+    clave, ruta = _buscar_en_cache(db, data.tipo, data.formato)
+    return jobs.enviar(data.tipo, data.formato, user.id, clave, ruta)
 
-    pdf = SimpleDocTemplate(archivo, pagesize=letter)
-    elementos = []
-    estilos = getSampleStyleSheet()
 
-    elementos.append(Paragraph("REPORTE DE PAGOS", estilos["Title"]))
+# ✅ Consultar estado
+@router.get("/jobs/{job_id}")
+def estado_job(job_id: str, user=Depends(get_current_user)):
+    return jobs.consultar(job_id, user.id)
 
-    tabla_data = [["ID Pago", "Préstamo", "Monto", "Fecha", "Estado"]]
 
-    for p in pagos:
-        tabla_data.append([
-            p.id,
-            p.prestamo_id,
-            p.monto_pagado,
-            str(p.fecha_pago),
-            p.estado
-        ])
+# ✅ Descargar cuando esté listo
+@router.get("/jobs/{job_id}/descargar")
+def descargar_job(job_id: str, user=Depends(get_current_user)):
+    estado = jobs.consultar(job_id, user.id)
+    if estado["estado"] == "error":
+        raise HTTPException(status_code=500, detail=f"El reporte falló: {estado['error']}")
+    if estado["estado"] != "listo":
+        raise HTTPException(status_code=409, detail="El reporte aún no está listo")
 
-    tabla = Table(tabla_data)
-    tabla.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold")
-    ]))
+    trabajo = jobs.obtener(job_id, user.id)
+    if not os.path.exists(trabajo["ruta"]):
+        raise HTTPException(status_code=410, detail="El reporte expiró, vuelva a solicitarlo")
 
-    elementos.append(tabla)
-    pdf.build(elementos)
-
-    return FileResponse(archivo, media_type="application/pdf", filename=archivo)
+    extension, media_type = FORMATOS[trabajo["formato"]]
+    return FileResponse(
+        trabajo["ruta"],
+        media_type=media_type,
+        filename=f"{trabajo['tipo']}_reporte.{extension}"
+    )
@@ -70,6 +70,9 @@ class PagoBase(BaseModel):
 class PagoCreate(PagoBase):
     pass
 
+class PagoBulkCreate(BaseModel):
+    pagos: List[PagoCreate] = Field(..., min_length=1, max_length=5000)
+
 class PagoResponse(PagoBase):
     id: int
     cliente: Optional[Cliente] = None             # ✅ trae nombre del cliente
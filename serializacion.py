@@ -0,0 +1,73 @@
+import os
+import types
+from typing import Union, get_args, get_origin
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import schemas
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional: sin ella se usa la ruta normal de FastAPI
+    orjson = None
+
+# Ruta rápida opcional: serializadores precalculados + orjson (RESPUESTAS_RAPIDAS=1)
+RESPUESTAS_RAPIDAS = os.getenv("RESPUESTAS_RAPIDAS", "0") == "1" and orjson is not None
+
+
+class RespuestaRapida(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _tipo_base(anotacion):
+    # Optional[X] -> X
+    if get_origin(anotacion) in (Union, types.UnionType):
+        argumentos = [a for a in get_args(anotacion) if a is not type(None)]
+        if len(argumentos) == 1:
+            return argumentos[0]
+    return anotacion
+
+
+# ✅ Serializador armado una sola vez a partir del esquema (mismo orden y forma que Pydantic)
+def construir_serializador(esquema: type[BaseModel]):
+    campos = []
+    for nombre, campo in esquema.model_fields.items():
+        tipo = _tipo_base(campo.annotation)
+        if isinstance(tipo, type) and issubclass(tipo, BaseModel):
+            campos.append((nombre, construir_serializador(tipo), True))
+        else:
+            campos.append((nombre, float if tipo is float else None, False))
+
+    def serializar(obj):
+        if obj is None:
+            return None
+        datos = {}
+        for nombre, conversion, anidado in campos:
+            valor = getattr(obj, nombre)
+            if anidado:
+                datos[nombre] = conversion(valor)
+            elif conversion is not None and valor is not None:
+                datos[nombre] = conversion(valor)
+            else:
+                datos[nombre] = valor
+        return datos
+
+    return serializar
+
+
+serializar_prestamo = construir_serializador(schemas.Prestamo)
+serializar_pago = construir_serializador(schemas.PagoResponse)
+
+
+def respuesta_lista(objetos, serializar):
+    return RespuestaRapida([serializar(obj) for obj in objetos])
+
+
+# Datos ya planos (dicts): orjson si está habilitado, si no el codificador de FastAPI
+def respuesta_json(datos):
+    if RESPUESTAS_RAPIDAS:
+        return RespuestaRapida(datos)
+    return JSONResponse(jsonable_encoder(datos))
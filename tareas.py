@@ -0,0 +1,143 @@
+import os
+import threading
+import traceback
+from datetime import datetime, time, timedelta
+from sqlalchemy import text
+import database
+import crud
+import idempotencia
+import resumen
+
+# Configuración del programador de tareas (hora local, formato HH:MM)
+TAREAS_HABILITADAS = os.getenv("TAREAS_HABILITADAS", "1") == "1"
+ATRASADOS_HORA = os.getenv("ATRASADOS_HORA", "00:05")
+RECONCILIAR_HORA = os.getenv("RECONCILIAR_HORA", "03:00")
+IDEMPOTENCIA_PURGA_HORA = os.getenv("IDEMPOTENCIA_PURGA_HORA", "04:00")
+
+
+def _hora(valor):
+    horas, minutos = valor.split(":")
+    return time(int(horas), int(minutos))
+
+
+class Tarea:
+    def __init__(self, nombre, hora, funcion):
+        self.nombre = nombre
+        self.hora = _hora(hora)
+        self.funcion = funcion
+        self.ejecutando = threading.Lock()
+        self.proxima = self._siguiente(datetime.now())
+        self.ultima_ejecucion = None
+        self.ultimo_resultado = None
+        self.ultimo_error = None
+
+    def _siguiente(self, desde):
+        candidata = datetime.combine(desde.date(), self.hora)
+        return candidata if candidata > desde else candidata + timedelta(days=1)
+
+    def ejecutar(self):
+        # Protección contra solapamiento dentro del proceso
+        if not self.ejecutando.acquire(blocking=False):
+            return False
+        try:
+            # Conexión dedicada: el bloqueo de MySQL pertenece a la conexión
+            with database.engine.connect() as conexion:
+                if not _bloqueo_global(conexion, self.nombre):
+                    return False
+                try:
+                    db = database.SessionLocal(bind=conexion)
+                    try:
+                        self.ultimo_resultado = self.funcion(db)
+                        self.ultimo_error = None
+                    finally:
+                        db.close()
+                finally:
+                    _liberar_bloqueo_global(conexion, self.nombre)
+            self.ultima_ejecucion = datetime.now()
+        except Exception:
+            self.ultimo_error = traceback.format_exc(limit=3)
+            self.ultima_ejecucion = datetime.now()
+        finally:
+            self.ejecutando.release()
+        return True
+
+
+# ✅ ...y entre procesos/servidores cuando la base es MySQL
+def _bloqueo_global(conexion, nombre):
+    if conexion.dialect.name != "mysql":
+        return True
+    obtenido = conexion.execute(text("SELECT GET_LOCK(:nombre, 0)"), {"nombre": f"tarea_{nombre}"}).scalar() == 1
+    conexion.commit()
+    return obtenido
+
+
+def _liberar_bloqueo_global(conexion, nombre):
+    if conexion.dialect.name == "mysql":
+        conexion.execute(text("SELECT RELEASE_LOCK(:nombre)"), {"nombre": f"tarea_{nombre}"})
+        conexion.commit()
+
+
+# ✅ Tareas de mantenimiento
+def _marcar_atrasados(db):
+    return crud.marcar_atrasados(db)
+
+
+def _reconciliar_resumen(db):
+    valores = resumen.recalcular(db)
+    resumen.reconstruir_meses(db)
+    db.commit()
+    return valores
+
+
+def _purgar_idempotencia(db):
+    return idempotencia.purgar(db)
+
+
+tareas = [
+    Tarea("marcar_atrasados", ATRASADOS_HORA, _marcar_atrasados),
+    Tarea("reconciliar_resumen", RECONCILIAR_HORA, _reconciliar_resumen),
+    Tarea("purgar_idempotencia", IDEMPOTENCIA_PURGA_HORA, _purgar_idempotencia),
+]
+
+_detener = threading.Event()
+_hilo = None
+
+
+def _bucle():
+    while not _detener.is_set():
+        ahora = datetime.now()
+        for tarea in tareas:
+            if tarea.proxima <= ahora:
+                tarea.proxima = tarea._siguiente(ahora)
+                threading.Thread(target=tarea.ejecutar, name=f"tarea-{tarea.nombre}", daemon=True).start()
+
+        espera = min(t.proxima for t in tareas) - datetime.now()
+        _detener.wait(max(1.0, min(espera.total_seconds(), 60.0)))
+
+
+def iniciar():
+    global _hilo
+    if not TAREAS_HABILITADAS or (_hilo and _hilo.is_alive()):
+        return
+    _detener.clear()
+    _hilo = threading.Thread(target=_bucle, name="programador-tareas", daemon=True)
+    _hilo.start()
+
+
+def detener():
+    _detener.set()
+
+
+def estado():
+    return [
+        {
+            "nombre": t.nombre,
+            "hora": t.hora.strftime("%H:%M"),
+            "proxima": t.proxima,
+            "ejecutando": t.ejecutando.locked(),
+            "ultima_ejecucion": t.ultima_ejecucion,
+            "ultimo_resultado": t.ultimo_resultado,
+            "ultimo_error": t.ultimo_error,
+        }
+        for t in tareas
+    ]
@@ -0,0 +1,226 @@
+import base64
+import binascii
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, func, select, inspect
+
+
+# ✅ CURSORES OPACOS (paginación keyset)
+def codificar_cursor(valores):
+    crudo = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in valores])
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, columnas):
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if not isinstance(valores, list) or len(valores) != len(columnas):
+            raise ValueError("cursor incompleto")
+
+        resultado = []
+        for columna, valor in zip(columnas, valores):
+            tipo = columna.type.python_type
+            if tipo is date:
+                valor = date.fromisoformat(valor)
+            elif tipo is datetime:
+                valor = datetime.fromisoformat(valor)
+            else:
+                valor = tipo(valor)
+            resultado.append(valor)
+        return resultado
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+# ✅ (a, b) > (x, y) expandido para que el motor use el índice
+def filtro_keyset(columnas, valores):
+    condiciones = []
+    for i, columna in enumerate(columnas):
+        iguales = [columnas[j] == valores[j] for j in range(i)]
+        condiciones.append(and_(*iguales, columna > valores[i]))
+    return or_(*condiciones)
+
+
+def paginar_keyset(query, columnas, cursor, limit: int):
+    if cursor:
+        query = query.filter(filtro_keyset(columnas, decodificar_cursor(cursor, columnas)))
+
+    # Se pide una fila extra para saber si existe una página siguiente
+    filas = query.order_by(*columnas).limit(limit + 1).all()
+    hay_mas = len(filas) > limit
+    filas = filas[:limit]
+
+    siguiente = None
+    if hay_mas:
+        ultimo = filas[-1]
+        siguiente = codificar_cursor([getattr(ultimo, c.key) for c in columnas])
+
+    return filas, siguiente
+
+
+# ✅ CONTEO CACHEADO (evita COUNT(*) completo en cada página)
+CONTEO_TTL_SEGUNDOS = 30
+_conteos = {}
+
+
+def contar_estimado(db, modelo, ttl: int = CONTEO_TTL_SEGUNDOS):
+    ahora = time.monotonic()
+    guardado = _conteos.get(modelo.__tablename__)
+    if guardado and ahora - guardado[1] < ttl:
+        return guardado[0]
+
+    total = db.query(func.count(modelo.id)).scalar() or 0
+    _conteos[modelo.__tablename__] = (total, ahora)
+    return total
+
+
+# ✅ PAGINACIÓN (offset clásico o cursor keyset)
+MAX_POR_PAGINA = 500
+
+
+def paginar(db, query, modelo, columnas, page: int, limit: int, cursor=None, incluir_total: bool = True):
+    if page < 1 or limit < 1:
+        raise HTTPException(status_code=400, detail="page y limit deben ser mayores a 0")
+    # Tope por página: "por_pagina" en la respuesta indica el límite aplicado
+    limit = min(limit, MAX_POR_PAGINA)
+
+    if cursor:
+        # Modo cursor: busca directo por índice, el costo no depende de la profundidad
+        data, siguiente = paginar_keyset(query, columnas, cursor, limit)
+        if not incluir_total:
+            total = None
+        elif query.whereclause is not None:
+            # Con filtros el estimado de la tabla no sirve: se cuenta la consulta filtrada
+            total = query.order_by(None).count()
+        else:
+            total = contar_estimado(db, modelo)
+    else:
+        inicio = (page - 1) * limit
+        filas = query.order_by(*columnas).offset(inicio).limit(limit + 1).all()
+        data = filas[:limit]
+        siguiente = None
+        if len(filas) > limit:
+            siguiente = codificar_cursor([getattr(data[-1], c.key) for c in columnas])
+        total = query.count() if incluir_total else None
+
+    return {
+        "pagina": None if cursor else page,
+        "por_pagina": limit,
+        "total_registros": total,
+        "total_paginas": (total + limit - 1) // limit if total is not None else None,
+        "next_cursor": siguiente,
+        "data": data
+    }
+
+
+# ✅ CACHÉ EN MEMORIA CON TTL Y EXPULSIÓN LRU (segura entre hilos)
+class CacheLRU:
+    def __init__(self, max_entradas: int, ttl: float):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            valor, vence = entrada
+            if vence <= time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor, ttl: float = None):
+        vence = time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl))
+        with self._lock:
+            self._datos[clave] = (valor, vence)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+
+# ✅ SELECCIÓN DISPERSA: ?fields=id,monto_restante,cliente.nombre&expand=cliente
+def _lista(valor):
+    return [v.strip() for v in valor.split(",") if v.strip()] if valor else []
+
+
+def proyeccion(modelo, relaciones, fields=None, expand=None):
+    """SELECT solo de columnas (sin entidades ORM) y la función que arma cada fila."""
+    campos = _lista(fields)
+    if fields is not None and not campos:
+        raise HTTPException(status_code=400, detail="fields no contiene ningún campo válido")
+    expandir = list(dict.fromkeys(_lista(expand) + [c.split(".", 1)[0] for c in campos if "." in c]))
+
+    for rel in expandir:
+        if rel not in relaciones:
+            opciones = ", ".join(relaciones) or "ninguna"
+            raise HTTPException(status_code=400, detail=f"No se puede expandir '{rel}'. Opciones: {opciones}")
+
+    def columnas_de(tabla, pedidas):
+        for nombre in pedidas:
+            if nombre not in tabla.c:
+                raise HTTPException(status_code=400, detail=f"Campo desconocido: {nombre}")
+        return pedidas or list(tabla.c.keys())
+
+    # Con fields, la clave primaria siempre va y solo se suman las columnas propias pedidas
+    # (fields=cliente.nombre devuelve id y cliente, no todas las columnas del modelo)
+    propios = [c for c in campos if "." not in c]
+    if campos:
+        clave = [c.key for c in inspect(modelo).primary_key]
+        propios = list(dict.fromkeys(clave + (columnas_de(modelo.__table__, propios) if propios else [])))
+    else:
+        propios = list(modelo.__table__.c.keys())
+    columnas = [modelo.__table__.c[nombre].label(nombre) for nombre in propios]
+
+    anidados = {}
+    consulta_joins = []
+    for rel in expandir:
+        relacion = inspect(modelo).relationships[rel]
+        tabla = relacion.mapper.local_table
+        pedidas = [c.split(".", 1)[1] for c in campos if c.startswith(rel + ".")]
+        anidados[rel] = columnas_de(tabla, pedidas)
+        columnas += [tabla.c[nombre].label(f"{rel}__{nombre}") for nombre in anidados[rel]]
+        consulta_joins.append(getattr(modelo, rel))
+
+    consulta = select(*columnas).select_from(modelo)
+    for relacion in consulta_joins:
+        consulta = consulta.outerjoin(relacion)
+    consulta = consulta.order_by(*inspect(modelo).primary_key)
+
+    def armar(filas):
+        resultado = []
+        for fila in filas:
+            m = fila._mapping
+            item = {nombre: m[nombre] for nombre in propios}
+            for rel, nombres in anidados.items():
+                valores = {nombre: m[f"{rel}__{nombre}"] for nombre in nombres}
+                # Sin fila relacionada (outer join) se devuelve null, como en los esquemas
+                item[rel] = valores if any(v is not None for v in valores.values()) else None
+            resultado.append(item)
+        return resultado
+
+    return consulta, armar
+
+
+def seleccion_dispersa(db, modelo, relaciones, fields=None, expand=None):
+    consulta, armar = proyeccion(modelo, relaciones, fields, expand)
+    return armar(db.execute(consulta))
@@ -0,0 +1,55 @@
+import sys
+from datetime import date
+from sqlalchemy import select, func
+from database import engine
+from models import Prestamo, Pago
+
+# Falla (código 1) si alguna consulta crítica vuelve a recorrer la tabla completa.
+# En MySQL conviene correrlo con datos reales: con tablas casi vacías el optimizador puede preferir un escaneo.
+HOY = date.today()
+DESDE = date(HOY.year, 1, 1)
+
+CONSULTAS = {
+    "conteo de préstamos por estado": select(func.count()).select_from(Prestamo).where(Prestamo.estado == "Atrasado"),
+    "barrido de atrasados": select(Prestamo.id).where(
+        Prestamo.estado == "Activo", Prestamo.fecha_limite < HOY, Prestamo.monto_restante > 0
+    ),
+    "vencimientos por rango": select(Prestamo.id).where(Prestamo.fecha_limite.between(DESDE, HOY)),
+    "préstamos de un cliente": select(Prestamo).where(Prestamo.cliente_id == 1, Prestamo.estado == "Activo"),
+    "pagos de un cliente": select(Pago).where(Pago.cliente_id == 1).order_by(Pago.fecha_pago),
+    "pagos de un préstamo": select(Pago).where(Pago.prestamo_id == 1).order_by(Pago.fecha_pago),
+    "pagos por rango de fechas": select(Pago.id, Pago.monto_pagado).where(Pago.fecha_pago.between(DESDE, HOY)),
+}
+
+
+def plan(conexion, consulta):
+    compilada = consulta.compile(dialect=conexion.dialect)
+    if compilada.positional:
+        parametros = tuple(compilada.params[nombre] for nombre in compilada.positiontup)
+    else:
+        parametros = compilada.params
+
+    if conexion.dialect.name == "sqlite":
+        filas = conexion.exec_driver_sql(f"EXPLAIN QUERY PLAN {compilada}", parametros).all()
+        return [fila[-1] for fila in filas]
+    filas = conexion.exec_driver_sql(f"EXPLAIN {compilada}", parametros).mappings().all()
+    return [f"{fila['table']}: type={fila['type']} key={fila['key']}" for fila in filas]
+
+
+def es_escaneo_completo(linea):
+    # SQLite: "SCAN prestamos" (SEARCH usa índice); MySQL: type=ALL o type=index
+    return linea.startswith("SCAN ") or "type=ALL" in linea or "type=index " in linea
+
+
+fallas = 0
+with engine.connect() as conexion:
+    for nombre, consulta in CONSULTAS.items():
+        lineas = plan(conexion, consulta)
+        escaneos = [l for l in lineas if es_escaneo_completo(l)]
+        fallas += bool(escaneos)
+        print(f"{'❌' if escaneos else '✅'} {nombre}: {' | '.join(lineas)}")
+
+if fallas:
+    print(f"\n❌ {fallas} consulta(s) sin índice")
+    sys.exit(1)
+print("\n✅ Todas las consultas usan índices")
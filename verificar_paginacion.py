@@ -0,0 +1,62 @@
+import time
+from datetime import date, timedelta
+from database import SessionLocal
+from models import Cliente, Prestamo
+from utils import paginar
+
+# Verifica que total_registros coincida entre el modo offset y el modo cursor, con y sin filtros.
+# Crea sus propios registros y los borra al terminar (usar una base de pruebas).
+PRESTAMOS = 25
+POR_PAGINA = 10
+
+
+def crear_prestamos(db, cliente_id):
+    hoy = date.today()
+    for i in range(PRESTAMOS):
+        # Un préstamo de cada cinco queda atrasado
+        estado = "Atrasado" if i % 5 == 0 else "Activo"
+        db.add(Prestamo(
+            cliente_id=cliente_id, monto_inicial=100, total_interes=0, monto_pagado=0,
+            monto_restante=100, estado=estado, fecha_inicio=hoy, fecha_limite=hoy + timedelta(days=30)
+        ))
+    db.commit()
+
+
+def recorrer(db, consulta):
+    # Primera página por offset y el resto por cursor, como lo hace un cliente de la API
+    pagina = paginar(db, consulta, Prestamo, [Prestamo.id], 1, POR_PAGINA)
+    totales = [pagina["total_registros"]]
+    filas = len(pagina["data"])
+    while pagina["next_cursor"]:
+        pagina = paginar(db, consulta, Prestamo, [Prestamo.id], 1, POR_PAGINA, pagina["next_cursor"])
+        totales.append(pagina["total_registros"])
+        filas += len(pagina["data"])
+    return filas, totales
+
+
+def verificar(nombre, db, consulta):
+    esperado = consulta.count()
+    filas, totales = recorrer(db, consulta)
+    ok = filas == esperado and all(total == esperado for total in totales)
+    print(f"{'✅' if ok else '❌'} {nombre}: {filas} filas, totales por página {totales} (esperado {esperado})")
+    return ok
+
+
+db = SessionLocal()
+cliente = Cliente(nombre="Verificar paginación", cedula=f"paginacion-{time.time_ns()}", monto=0)
+db.add(cliente)
+db.commit()
+
+try:
+    crear_prestamos(db, cliente.id)
+    del_cliente = db.query(Prestamo).filter(Prestamo.cliente_id == cliente.id)
+    ok = verificar("préstamos del cliente", db, del_cliente)
+    ok = verificar("atrasados del cliente", db, del_cliente.filter(Prestamo.estado == "Atrasado")) and ok
+finally:
+    db.expire_all()
+    db.delete(db.query(Cliente).filter(Cliente.id == cliente.id).one())
+    db.commit()
+    db.close()
+
+print("\n✅ Verificación superada" if ok else "\n❌ Verificación fallida")
+raise SystemExit(0 if ok else 1)